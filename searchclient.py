@@ -1,7 +1,9 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 import os
 import sys
+import time
 from typing import Any, List
 
 from src.domain.action import Action
@@ -10,6 +12,7 @@ from src.domain.state import State
 from src.frontiers.baseline.best_first import FrontierBestFirst
 from src.frontiers.baseline.bfs import FrontierBFS
 from src.frontiers.baseline.dfs import FrontierDFS
+from src.frontiers.bfws import FrontierBFWS
 from src.frontiers.iw import FrontierIW
 from src.heuristics.baseline.astar import HeuristicAStar
 from src.heuristics.complex_dijkstra import HeuristicComplexDijkstra
@@ -17,7 +20,8 @@ from src.heuristics.baseline.manhattan import HeuristicManhattan
 from src.heuristics.baseline.simple import HeuristicSimple
 from src.heuristics.baseline.simple_dijkstra import HeuristicSimpleDijkstra
 from src.heuristics.baseline.wastar import HeuristicWeightedAStar
-from src.searches.graphsearch import SIW, Info, graph_search, save_run_information
+from src.heuristics.distance_table import DistanceTable
+from src.searches.graphsearch import GOAL_ORDERS, SIW, Info, graph_search, order_goals, save_run_information, set_time_budget, start_time
 from src.utils import memory
 from src.utils.combiner import Combiner
 from src.utils.info import handle_debug
@@ -70,22 +74,25 @@ class SearchClient:
         elif args.dfs:
             return FrontierDFS()
         elif args.astar:
-            return FrontierBestFirst(HeuristicAStar(initial_state))
+            return FrontierBestFirst(HeuristicAStar(initial_state), args.deferred, args.lifo)
         elif args.wastar is not False:
-            return FrontierBestFirst(HeuristicWeightedAStar(initial_state, args.wastar))
+            return FrontierBestFirst(HeuristicWeightedAStar(initial_state, args.wastar), args.deferred, args.lifo)
         elif args.greedy:
-            return FrontierBestFirst(heuristic)
+            return FrontierBestFirst(heuristic, args.deferred, args.lifo)
+        elif args.bfws:
+            return FrontierBFWS(heuristic, goal_count=args.goal_count, deferred=args.deferred, lifo=args.lifo)
         else:
-            width = min(
+            # A region can hold goals without any agent or box, its search still needs a width of 1
+            width = max(min(
                 len(initial_state.agent_locations) + len(initial_state.box_locations),
                 initial_width,
-            )
+            ), 1)
             print(
                 f"Starting Iterated Width search with the width of {width}.",
                 file=sys.stderr,
                 flush=True,
             )
-            return FrontierIW(heuristic, width)
+            return FrontierIW(heuristic, width, args.deferred, args.lifo)
 
     @staticmethod
     def init_client():
@@ -118,7 +125,7 @@ class SearchClient:
     @staticmethod
     def execute_and_print_plan(initial_state, frontier, heuristic, server_messages):
         if args.siw:
-            plan = SIW(initial_state, frontier)
+            plan = SIW(initial_state, frontier, order_goals(initial_state, args.goal_order))
         else: 
             plan = graph_search(initial_state, frontier)
 
@@ -185,44 +192,104 @@ class SearchClient:
         sub_levels = SearchClient.iterative_splitting(sub_levels)
         SearchClient.split_count = len(sub_levels)
 
-        # do everything and create all plans from a-z, loop for all leveldatas
-        # planCreationLoop
-        plans = []
-        exploreds = 0
-        frontier_sizes = 0
-        for i, level in enumerate(sub_levels):
-            # setup
-            level.convert_dead_boxes_to_walls()
-            level.normalize_agent_identifiers()
-            level.to_string_representation()  # important don't remove
-
-            initial_state, heuristic, frontier = SearchClient.initialize_and_configure(args, level)
-
-            # create plan
-            print(f"Starting {frontier.get_name()} for level {i}.", file=sys.stderr, flush=True)
-            if args.siw:
-                plan = SIW(initial_state, frontier)
-            else: 
-                plan, n_explored, frontier_size = graph_search(initial_state, frontier)
-
-            if plan is None:
-                print("Unable to solve level.", file=sys.stderr, flush=True)
-                sys.exit(0)
-            else:
-                plan = Combiner.revert_plan_identifiers_listofactions(level, plan)
-                plans.append(plan)
-                exploreds += n_explored
-                frontier_sizes += frontier_size
+        # The regions are independent, every one is solved in its own process (in this one if there is only one).
+        # All regions share one deadline, a region gets at most region_time of the time that is left.
+        workers = min(len(sub_levels), args.workers or os.cpu_count() or 1)
+        region_memory = args.max_memory / workers
+        deadline = start_time + args.region_time
+        results = [None] * len(sub_levels)
+        if workers == 1:
+            for i, level in enumerate(sub_levels):
+                results[i] = SearchClient.solve_region(args, region_memory, deadline, i, level)
+                if results[i][0] is None:
+                    break
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            futures = [
+                executor.submit(SearchClient.solve_region, args, region_memory, deadline, i, level)
+                for i, level in enumerate(sub_levels)
+            ]
+            try:
+                for future in as_completed(futures):
+                    i = futures.index(future)
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:  # The worker failed or was killed (BrokenProcessPool)
+                        print(f"Region {i} failed: {e!r}", file=sys.stderr, flush=True)
+                        break
+                    if results[i][0] is None:
+                        break
+            finally:
+                SearchClient.terminate_pool(executor)
+
+        if any(result is None or result[0] is None for result in results):
+            print("Unable to solve level.", file=sys.stderr, flush=True)
+            sys.exit(0)
+        plans = [plan for plan, _, _, _ in results]
+        n_explored = sum(result[1] for result in results)
+        frontier_size = sum(result[2] for result in results)
+        width = results[-1][3]
 
         # combine plans
         final_plan = Combiner.combine_plans(plans, leveldata)
-        save_run_information(n_explored, frontier_size, final_plan, width=frontier.width if isinstance(frontier, FrontierIW) else None)
+        save_run_information(n_explored, frontier_size, final_plan, width=width)
         
         # global object reset, necessary
         initial_state, heuristic, frontier = SearchClient.initialize_and_configure(args, leveldata)
 
         SearchClient.print_found_plan_stuff(final_plan, initial_state, heuristic, args, server_messages)
 
+    @staticmethod
+    def solve_region(args, max_memory: float, deadline: float, i: int, level: LevelData):
+        """
+        Solve one region of split_search within the time and memory budget of a region, and before the deadline
+        (time.perf_counter) of the whole level. Runs in a worker process, which sets up the class-level level data
+        (State, Location, ActionTable, ...) of its own region.
+        Returns (plan with the original agent identifiers or None, #explored, #frontier, IW width).
+        """
+        SearchClient.configure(args)
+        memory.max_usage = max_memory
+        set_time_budget(min(args.region_time, deadline - time.perf_counter()))
+
+        level.convert_dead_boxes_to_walls()
+        level.normalize_agent_identifiers()
+        level.to_string_representation()  # important don't remove
+
+        initial_state, heuristic, frontier = SearchClient.initialize_and_configure(args, level)
+
+        # create plan
+        print(f"Starting {frontier.get_name()} for level {i}.", file=sys.stderr, flush=True)
+        if args.siw:
+            plan, n_explored, frontier_size = SIW(initial_state, frontier, order_goals(initial_state, args.goal_order))
+        else:
+            plan, n_explored, frontier_size = graph_search(initial_state, frontier)
+
+        width = frontier.width if isinstance(frontier, FrontierIW) else None
+        if plan is None:
+            print(f"Unable to solve region {i}.", file=sys.stderr, flush=True)
+            return None, n_explored, frontier_size, width
+        return Combiner.revert_plan_identifiers_listofactions(level, plan), n_explored, frontier_size, width
+
+    @staticmethod
+    def terminate_pool(executor: ProcessPoolExecutor):
+        """
+        Shut the pool down without waiting for the regions that are still being solved.
+        """
+        processes = list((executor._processes or {}).values())  # Not public, shutdown has no way to stop workers
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    @staticmethod
+    def configure(args):
+        """
+        Process-wide settings from the program arguments, applied again in every worker process.
+        """
+        memory.max_usage = args.max_memory
+        State.operator_decomposition = args.od
+        State.macro_actions = args.macros
+        DistanceTable.cache_dir = args.distance_cache or None
+
     @staticmethod
     def print_found_plan_stuff(plan, initial_state, heuristic, args, server_messages):
         print(
@@ -361,6 +428,33 @@ if __name__ == "__main__":
         required=False,
     )
 
+    parser.add_argument(
+        "--workers",
+        metavar="<count>",
+        type=int,
+        default=0,
+        help="Number of processes solving the independent regions of a level in parallel (default: one per core).",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--region-time",
+        metavar="<seconds>",
+        type=float,
+        default=170.0,
+        help="Time budget of the search of every region, the regions together end this many seconds after the start (default 170).",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--distance-cache",
+        metavar="<cache_dir>",
+        type=str,
+        default="./.distance_cache",
+        help="Folder where precomputed distance tables are stored and memory-mapped from (empty to disable).",
+        required=False,
+    )
+
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -382,6 +476,48 @@ if __name__ == "__main__":
         help="Enable profiling with cProfile.",
     )
 
+    parser.add_argument(
+        "--goal-order",
+        choices=GOAL_ORDERS,
+        default="alternate",
+        help="Order in which SIW reaches the goals: agent and box goals alternating, agent goals first or box goals first (default alternate).",
+    )
+
+    parser.add_argument(
+        "--od",
+        action="store_true",
+        default=False,
+        help="Expand multi-agent states by operator decomposition (one agent per search node).",
+    )
+
+    parser.add_argument(
+        "--macros",
+        action="store_true",
+        default=False,
+        help="Move agents (and the boxes they push or pull) through tunnels in a single search step.",
+    )
+
+    parser.add_argument(
+        "--deferred",
+        action="store_true",
+        default=False,
+        help="Deferred heuristic evaluation: queue states with their parent's value and evaluate them when popped.",
+    )
+
+    parser.add_argument(
+        "--lifo",
+        action="store_true",
+        default=False,
+        help="Break ties between equal priorities last-in-first-out instead of first-in-first-out.",
+    )
+
+    parser.add_argument(
+        "--goal-count",
+        action="store_true",
+        default=False,
+        help="Partition BFWS novelty by the number of unsatisfied goals as well as by h.",
+    )
+
     strategy_group = parser.add_mutually_exclusive_group()
     strategy_group.add_argument(
         "-bfs", action="store_true", dest="bfs", help="Use the BFS strategy."
@@ -408,6 +544,9 @@ if __name__ == "__main__":
     strategy_group.add_argument(
         "-greedy", action="store_true", dest="greedy", help="Use the Greedy strategy."
     )
+    strategy_group.add_argument(
+        "-bfws", action="store_true", dest="bfws", help="Use the BFWS strategy."
+    )
 
     strategy_group2 = parser.add_mutually_exclusive_group()
     strategy_group2.add_argument(
@@ -434,8 +573,8 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    # Set max memory usage allowed (soft limit).
-    memory.max_usage = args.max_memory
+    # Set max memory usage allowed (soft limit) and the other process-wide settings.
+    SearchClient.configure(args)
     if args.debug:
         handle_debug(True)
     if args.profile:
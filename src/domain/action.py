@@ -1,41 +1,74 @@
+from copy import copy
 from enum import Enum, unique
 from src.domain.atom import *
+from src.domain.deadlock import Deadlocks
+from src.domain.location import Location
+from src.domain.map_analysis import MapAnalysis
 
 
 class Action:
     def __init__(self, agt: int):
         self.agt = agt
+        self.name = "NoOp"
+        # Cell that is free before and occupied after the action, and the box it moves (used for conflict checks)
+        self.enter_cell: Cell = None
+        self.box: Box = None
+        # Moves a box of a letter with surplus boxes into a dead cell, see Deadlocks.classify
+        self.enters_dead = False
+        # Number of plan steps the action takes, and for macros every cell it enters (see Macro)
+        self.length = 1
+        self.path_cells: frozenset[Cell] = None
 
     def __repr__(self) -> str:
         return f"Action({self.agt})"
 
-    def check_preconditions(self, literals: LiteralList):
+    def check_preconditions(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray):
         return True
 
-    def apply_effects(self, literals: LiteralList, skip_check = False):
-        return literals
+    def apply_effects(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray = None, skip_check = False):
+        return agent_cells, box_cells, occupancy
+
+    def hash_delta(self) -> int:
+        """
+        Zobrist key difference between the state before and after applying the action,
+        i.e. the XOR of the keys of all removed and added atoms.
+        """
+        return 0
+
+    def goal_delta(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        """
+        Change of the number of satisfied goals, given the goal cell of every agent (-1 if none)
+        and the box letter of every box goal cell.
+        """
+        return 0
 
     def get_name(self):
         return "NoOp"
     
     def update_id(self, agt: int):
-        self.agt = agt
-        return self
+        # Actions are shared between states (see ActionTable), so an updated copy is returned
+        action = copy(self)
+        action.agt = agt
+        return action
 
 class Move(Action):
     def __init__(self, agt: int, agtfrom: Pos, agtto: Pos):
         super().__init__(agt)
         self.agtfrom = agtfrom
         self.agtto = agtto
+        self.agtfrom_cell = Location.cell(agtfrom)
+        self.agtto_cell = Location.cell(agtto)
+        self.enter_cell = self.agtto_cell
         self.agt_old = encode_agent(agtfrom, agt)
         self.agt_new = encode_agent(agtto, agt)
+        self.name = self.get_name()
 
     def __repr__(self) -> str:
         fr,fc = self.agtfrom
         tr,tc = self.agtto
         return f"Move({self.agt}, {(fr,fc)}, {(tr,tc)})"
 
-    def check_preconditions(self, literals: LiteralList):
+    def check_preconditions(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray):
         """
         Check if the preconditions of the Move action are satisfied in the given state.
         Preconditions:
@@ -44,13 +77,12 @@ class Move(Action):
         - Free(agtto)
         """
         return (
-            self.agt_old in literals[AtomType.AGENT_AT]
+            agent_cells[self.agt] == self.agtfrom_cell
             and eval_neighbour(self.agtfrom, self.agtto)
-            and eval_free(self.agtto, literals)
-            # and Free(self.agtto) in literals
+            and eval_free(self.agtto_cell, occupancy)
         )
 
-    def apply_effects(self, literals: LiteralList, skip_check = False):
+    def apply_effects(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray = None, skip_check = False):
         """
         Apply the effects of the Move action to the given state.
         Effects:
@@ -59,17 +91,25 @@ class Move(Action):
         - Free(agtfrom)
         - Not Free(agtto)
         """
-        if skip_check or self.check_preconditions(literals):
-            # ~AgentAt(agt,agtfrom)
-            literals[AtomType.AGENT_AT].remove(self.agt_old)
-            # AgentAt(agt,agtto)
-            literals[AtomType.AGENT_AT].add(self.agt_new)
-            # ~Free(agtto)
-            # Free(agtfrom)
-            return literals
+        if skip_check or self.check_preconditions(agent_cells, box_cells, occupancy):
+            # ~AgentAt(agt,agtfrom), AgentAt(agt,agtto)
+            agent_cells[self.agt] = self.agtto_cell
+            if occupancy is not None:
+                # ~Free(agtto)
+                occupancy[self.agtto_cell] = 1
+                # Free(agtfrom)
+                occupancy[self.agtfrom_cell] = 0
+            return agent_cells, box_cells, occupancy
         else:
             raise Exception("Preconditions not satisfied for the Move action.")
 
+    def hash_delta(self) -> int:
+        return zobrist_key(self.agt_old) ^ zobrist_key(self.agt_new)
+
+    def goal_delta(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        goal = agent_goal_cells[self.agt]
+        return (self.agtto_cell == goal) - (self.agtfrom_cell == goal)
+
     def get_name(self):
         agtfrom_row, agtfrom_col = self.agtfrom
         agtto_row, agtto_col = self.agtto
@@ -92,10 +132,11 @@ class Move(Action):
             return f"Move({agentMove})"
         
     def update_id(self, agt: int):
-        self.agt = agt
-        self.agt_old = encode_agent(self.agtfrom, agt)
-        self.agt_new = encode_agent(self.agtto, agt)
-        return self
+        action = copy(self)
+        action.agt = agt
+        action.agt_old = encode_agent(self.agtfrom, agt)
+        action.agt_new = encode_agent(self.agtto, agt)
+        return action
 
 
 class Push(Action):
@@ -107,10 +148,15 @@ class Push(Action):
         self.agtfrom = agtfrom
         self.boxfrom = boxfrom
         self.boxto = boxto
+        self.agtfrom_cell = Location.cell(agtfrom)
+        self.boxfrom_cell = Location.cell(boxfrom)
+        self.boxto_cell = Location.cell(boxto)
+        self.enter_cell = self.boxto_cell
         self.agt_old = encode_agent(agtfrom, agt)
         self.agt_new = encode_agent(boxfrom, agt)
         self.box_old = encode_box(boxfrom, box)
         self.box_new = encode_box(boxto, box)
+        self.name = self.get_name()
 
     def __repr__(self) -> str:
         afr,afc = self.agtfrom
@@ -118,7 +164,7 @@ class Push(Action):
         btr,btc = self.boxto
         return f"Push({self.agt}, {(afr,afc)}, {chr(self.box[0] + ord('A')),self.box[1]}, {(bfr,bfc)}, {(btr,btc)})"
 
-    def check_preconditions(self, literals: LiteralList):
+    def check_preconditions(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray):
         """
         Check if the preconditions of the Move action are satisfied in the given state.
         Preconditions:
@@ -129,15 +175,15 @@ class Push(Action):
         - Free(agtto)
         """
         return (
-            self.agt_old in literals[AtomType.AGENT_AT] #Agent_at
-            and self.box_old in literals[AtomType.BOX_AT] #Box_at
+            agent_cells[self.agt] == self.agtfrom_cell #Agent_at
+            and self.boxfrom_cell in box_cells #Box_at
             and eval_neighbour(self.agtfrom, self.boxfrom)
             and eval_neighbour(self.boxfrom, self.boxto)
-            and eval_free(self.boxto, literals)
-            and self.agtfrom != self.boxto
+            and eval_free(self.boxto_cell, occupancy)
+            and self.agtfrom_cell != self.boxto_cell
         )
 
-    def apply_effects(self, literals: LiteralList, skip_check = False):
+    def apply_effects(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray = None, skip_check = False):
         """
         Apply the effects of the Move action to the given state.
         Effects:
@@ -146,19 +192,36 @@ class Push(Action):
         - Free(agtfrom)
         - Not Free(boxfrom)
         """
-        if skip_check or self.check_preconditions(literals):
-            # ~AgentAt(agt,agtfrom)
-            literals[AtomType.AGENT_AT].remove(self.agt_old)
-            # AgentAt(agt,boxfrom)
-            literals[AtomType.AGENT_AT].add(self.agt_new)
-            # ~BoxAt(box,boxfrom)
-            literals[AtomType.BOX_AT].remove(self.box_old)
-            # BoxAt(box,boxto)
-            literals[AtomType.BOX_AT].add(self.box_new)
-            return literals
+        if skip_check or self.check_preconditions(agent_cells, box_cells, occupancy):
+            # ~AgentAt(agt,agtfrom), AgentAt(agt,boxfrom)
+            agent_cells[self.agt] = self.boxfrom_cell
+            # ~BoxAt(box,boxfrom), BoxAt(box,boxto)
+            box_cells[box_cells.index(self.boxfrom_cell)] = self.boxto_cell
+            if occupancy is not None:
+                # ~Free(boxto)
+                occupancy[self.boxto_cell] = 1
+                # Free(agtfrom)
+                occupancy[self.agtfrom_cell] = 0
+            return agent_cells, box_cells, occupancy
         else:
             raise Exception("Preconditions not satisfied for the Move action.")
 
+    def hash_delta(self) -> int:
+        return (
+            zobrist_key(self.agt_old)
+            ^ zobrist_key(self.agt_new)
+            ^ zobrist_key(self.box_old)
+            ^ zobrist_key(self.box_new)
+        )
+
+    def goal_delta(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        goal = agent_goal_cells[self.agt]
+        letter = self.box[0]
+        return (
+            (self.boxfrom_cell == goal) - (self.agtfrom_cell == goal)
+            + (box_goal_letters.get(self.boxto_cell) == letter) - (box_goal_letters.get(self.boxfrom_cell) == letter)
+        )
+
     def get_name(self):
         agtfrom_row, agtfrom_col = self.agtfrom
         boxfrom_row, boxfrom_col = self.boxfrom
@@ -193,10 +256,11 @@ class Push(Action):
             return f"Push({agentMove},{boxMove})"
 
     def update_id(self, agt: int):
-        self.agt = agt
-        self.agt_old = encode_agent(self.agtfrom, agt)
-        self.agt_new = encode_agent(self.boxfrom, agt)
-        return self
+        action = copy(self)
+        action.agt = agt
+        action.agt_old = encode_agent(self.agtfrom, agt)
+        action.agt_new = encode_agent(self.boxfrom, agt)
+        return action
 
 
 class Pull(Action):
@@ -208,10 +272,15 @@ class Pull(Action):
         self.agtto = agtto
         self.agtfrom = agtfrom
         self.boxfrom = boxfrom
+        self.agtfrom_cell = Location.cell(agtfrom)
+        self.agtto_cell = Location.cell(agtto)
+        self.boxfrom_cell = Location.cell(boxfrom)
+        self.enter_cell = self.agtto_cell
         self.agt_old = encode_agent(agtfrom, agt)
         self.agt_new = encode_agent(agtto, agt)
         self.box_old = encode_box(boxfrom, box)
         self.box_new = encode_box(agtfrom, box)
+        self.name = self.get_name()
 
     def __repr__(self) -> str:
         atr,atc = self.agtto
@@ -219,7 +288,7 @@ class Pull(Action):
         bfr,bfc = self.boxfrom
         return f"Pull({self.agt}, {(afr,afc)}, {(atr,atc)}, {chr(self.box[0] + ord('A')),self.box[1]}, {(bfr,bfc)})"
 
-    def check_preconditions(self, literals: LiteralList):
+    def check_preconditions(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray):
         """
         Check if the preconditions of the Move action are satisfied in the given state.
         Preconditions:
@@ -230,15 +299,15 @@ class Pull(Action):
         - Free(agtto)
         """
         return (
-            self.agt_old in literals[AtomType.AGENT_AT] #Agent_at
-            and self.box_old in literals[AtomType.BOX_AT] #Box_at
+            agent_cells[self.agt] == self.agtfrom_cell #Agent_at
+            and self.boxfrom_cell in box_cells #Box_at
             and eval_neighbour(self.agtfrom, self.agtto)
             and eval_neighbour(self.agtfrom, self.boxfrom)
-            and eval_free(self.agtto, literals)
-            and self.agtto != self.agtfrom
+            and eval_free(self.agtto_cell, occupancy)
+            and self.agtto_cell != self.agtfrom_cell
         )
 
-    def apply_effects(self, literals: LiteralList, skip_check = False):
+    def apply_effects(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray = None, skip_check = False):
         """
         Apply the effects of the Move action to the given state.
         Effects:
@@ -249,19 +318,36 @@ class Pull(Action):
         - Free(boxfrom)
         - Not Free(agtto)
         """
-        if skip_check or self.check_preconditions(literals):
-            # ~AgentAt(agt,agtfrom)
-            literals[AtomType.AGENT_AT].remove(self.agt_old)
-            # AgentAt(agt,agtto)
-            literals[AtomType.AGENT_AT].add(self.agt_new)
-            # ~BoxAt(box,boxfrom)
-            literals[AtomType.BOX_AT].remove(self.box_old)
-            # BoxAt(box,boxto)
-            literals[AtomType.BOX_AT].add(self.box_new)
-            return literals
+        if skip_check or self.check_preconditions(agent_cells, box_cells, occupancy):
+            # ~AgentAt(agt,agtfrom), AgentAt(agt,agtto)
+            agent_cells[self.agt] = self.agtto_cell
+            # ~BoxAt(box,boxfrom), BoxAt(box,agtfrom)
+            box_cells[box_cells.index(self.boxfrom_cell)] = self.agtfrom_cell
+            if occupancy is not None:
+                # ~Free(agtto)
+                occupancy[self.agtto_cell] = 1
+                # Free(boxfrom)
+                occupancy[self.boxfrom_cell] = 0
+            return agent_cells, box_cells, occupancy
         else:
             raise Exception("Preconditions not satisfied for the Move action.")
 
+    def hash_delta(self) -> int:
+        return (
+            zobrist_key(self.agt_old)
+            ^ zobrist_key(self.agt_new)
+            ^ zobrist_key(self.box_old)
+            ^ zobrist_key(self.box_new)
+        )
+
+    def goal_delta(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        goal = agent_goal_cells[self.agt]
+        letter = self.box[0]
+        return (
+            (self.agtto_cell == goal) - (self.agtfrom_cell == goal)
+            + (box_goal_letters.get(self.agtfrom_cell) == letter) - (box_goal_letters.get(self.boxfrom_cell) == letter)
+        )
+
     def get_name(self):
         agtto_row, agtto_col = self.agtto
         agtfrom_row, agtfrom_col = self.agtfrom
@@ -294,10 +380,80 @@ class Pull(Action):
             return f"Pull({agentMove},{boxMove})"
 
     def update_id(self, agt: int):
-        self.agt = agt
-        self.agt_old = encode_agent(self.agtfrom, agt)
-        self.agt_new = encode_agent(self.agtto, agt)
-        return self
+        action = copy(self)
+        action.agt = agt
+        action.agt_old = encode_agent(self.agtfrom, agt)
+        action.agt_new = encode_agent(self.agtto, agt)
+        return action
+
+
+class Macro(Action):
+    """
+    Primitive steps (Move, Push or Pull) of one agent through a tunnel, taken as one search step (see
+    ActionTable.get_tunnel). The cells entered by the steps must be free when the macro starts, the other
+    agents of a joint action perform their action in the first step and NoOp afterwards (see expand).
+    """
+    def __init__(self, steps: tuple[Action, ...]):
+        super().__init__(steps[0].agt)
+        self.steps = steps
+        self.box = steps[0].box
+        self.enter_cell = steps[0].enter_cell
+        self.length = len(steps)
+        self.path_cells = frozenset(step.enter_cell for step in steps)
+        self.name = self.get_name()
+
+    def __repr__(self) -> str:
+        return f"Macro({', '.join(repr(step) for step in self.steps)})"
+
+    def check_preconditions(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray):
+        agent_cells, box_cells, occupancy = agent_cells[:], box_cells[:], occupancy[:]
+        for step in self.steps:
+            if not step.check_preconditions(agent_cells, box_cells, occupancy):
+                return False
+            step.apply_effects(agent_cells, box_cells, occupancy, skip_check=True)
+        return True
+
+    def apply_effects(self, agent_cells: CellList, box_cells: CellList, occupancy: bytearray = None, skip_check = False):
+        if skip_check or self.check_preconditions(agent_cells, box_cells, occupancy):
+            for step in self.steps:
+                step.apply_effects(agent_cells, box_cells, occupancy, skip_check=True)
+            return agent_cells, box_cells, occupancy
+        else:
+            raise Exception("Preconditions not satisfied for the Macro action.")
+
+    def hash_delta(self) -> int:
+        delta = 0
+        for step in self.steps:
+            delta ^= step.hash_delta()
+        return delta
+
+    def goal_delta(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        return sum(step.goal_delta(agent_goal_cells, box_goal_letters) for step in self.steps)
+
+    def get_name(self):
+        return "|".join(step.get_name() for step in self.steps)
+
+    def update_id(self, agt: int):
+        return Macro(tuple(step.update_id(agt) for step in self.steps))
+
+    @staticmethod
+    def expand(joint_action: list[Action]) -> list[list[Action]]:
+        """
+        The primitive joint actions a joint action with macros stands for.
+        """
+        length = max(action.length for action in joint_action)
+        if length == 1:
+            return [joint_action]
+        steps = []
+        for i in range(length):
+            joint_step = []
+            for action in joint_action:
+                if i < action.length:
+                    joint_step.append(action.steps[i] if isinstance(action, Macro) else action)
+                else:
+                    joint_step.append(ActionTable.noops[action.agt])
+            steps.append(joint_step)
+        return steps
 
 
 @unique
@@ -334,3 +490,126 @@ class PossibleAction(Enum):
     PullEN = ("Pull(E,N)", Pull, 0, 1, -1, 0)
     PullWS = ("Pull(W,S)", Pull, 0, -1, 1, 0)
     PullES = ("Pull(E,S)", Pull, 0, 1, 1, 0)
+
+
+
+class ActionTable:
+    """
+    Preconstructed actions of the current level, keyed by agent (and box), cells and schema (see PossibleAction).
+    The actions of an agent at a cell are built the first time the agent stands there and are shared by all
+    states afterwards, so expansion only does lookups and occupancy checks.
+    """
+    noops: list[Action] = []
+    moves: dict[tuple[int, Cell], tuple[Move, ...]] = {}
+    box_actions: dict[tuple[int, Box, Cell, Cell], tuple[tuple[Push, ...], tuple[Pull, ...]]] = {}
+    tunnels: dict[Action, tuple[Action, ...]] = {}
+    macros: dict[tuple[Action, int], Macro] = {}
+    stop_cells: set[Cell] = set()  # Goal cells, tunnels end there (see get_tunnel)
+
+    @staticmethod
+    def reset(num_agents: int, stop_cells: set[Cell] = frozenset()):
+        ActionTable.noops = [Action(agent) for agent in range(num_agents)]
+        ActionTable.moves = {}
+        ActionTable.box_actions = {}
+        ActionTable.tunnels = {}
+        ActionTable.macros = {}
+        ActionTable.stop_cells = set(stop_cells)
+
+    @staticmethod
+    def is_free_cell(row: int, col: int) -> bool:
+        height, width = Location.walls.shape
+        return 0 <= row < height and 0 <= col < width and not Location.walls[row, col]
+
+    @staticmethod
+    def get_moves(agent: int, agtfrom: Pos) -> tuple[Move, ...]:
+        key = (agent, Location.cell(agtfrom))
+        moves = ActionTable.moves.get(key)
+        if moves is None:
+            moves = []
+            for schema in PossibleAction:
+                _, action_type, agent_drow, agent_dcol, _, _ = schema.value
+                agtto = Pos(agtfrom.row + agent_drow, agtfrom.col + agent_dcol)
+                if action_type is Move and ActionTable.is_free_cell(*agtto):
+                    moves.append(Move(agent, agtfrom, agtto))
+            moves = ActionTable.moves[key] = tuple(moves)
+        return moves
+
+    @staticmethod
+    def get_box_actions(agent: int, box: Box, agtfrom: Pos, boxfrom: Pos) -> tuple[tuple[Push, ...], tuple[Pull, ...]]:
+        """
+        All pushes and pulls of box at boxfrom by agent at agtfrom that are not blocked by walls
+        and do not move the box into a dead cell (see Deadlocks).
+        """
+        key = (agent, box, Location.cell(agtfrom), Location.cell(boxfrom))
+        box_actions = ActionTable.box_actions.get(key)
+        if box_actions is None:
+            pushes, pulls = [], []
+            for schema in PossibleAction:
+                _, action_type, agent_drow, agent_dcol, box_drow, box_dcol = schema.value
+                if action_type is Push and (agtfrom.row + agent_drow, agtfrom.col + agent_dcol) == boxfrom:
+                    boxto = Pos(boxfrom.row + box_drow, boxfrom.col + box_dcol)
+                    if ActionTable.is_free_cell(*boxto):
+                        ActionTable.add_box_action(pushes, Push(agent, agtfrom, box, boxfrom, boxto), boxto)
+                elif action_type is Pull and (agtfrom.row - box_drow, agtfrom.col - box_dcol) == boxfrom:
+                    agtto = Pos(agtfrom.row + agent_drow, agtfrom.col + agent_dcol)
+                    if ActionTable.is_free_cell(*agtto):
+                        ActionTable.add_box_action(pulls, Pull(agent, agtfrom, agtto, box, boxfrom), agtfrom)
+            box_actions = ActionTable.box_actions[key] = (tuple(pushes), tuple(pulls))
+        return box_actions
+
+    @staticmethod
+    def add_box_action(actions: list[Action], action: Push | Pull, boxto: Pos):
+        pruned, action.enters_dead = Deadlocks.classify(action.box[0], action.boxfrom_cell, Location.cell(boxto))
+        if not pruned:
+            actions.append(action)
+
+    @staticmethod
+    def get_tunnel(action: Action) -> tuple[Action, ...]:
+        """
+        The steps that continue action through a tunnel (see MapAnalysis.corridor), ignoring agents and boxes:
+        while the cell the action leads into (the agent's cell for moves and pulls, the box's cell for pushes)
+        has two free neighbours and is not a goal cell, the same kind of action goes on to the other neighbour.
+        """
+        tunnel = ActionTable.tunnels.get(action)
+        if tunnel is None:
+            steps = []
+            visited = set()
+            step = action
+            while step is not None:
+                lead, back = (step.boxto_cell, step.boxfrom_cell) if isinstance(step, Push) else (step.agtto_cell, step.agtfrom_cell)
+                if MapAnalysis.degree[lead] != 2 or lead in ActionTable.stop_cells or lead in visited:
+                    break
+                visited.add(lead)
+                ahead = next(
+                    Location.cell(n) for n in Location.get_neighbours(Location.positions[lead]) if Location.cell(n) != back
+                )
+                step = ActionTable.get_next_step(step, lead, back, ahead)
+                if step is not None:
+                    steps.append(step)
+            tunnel = ActionTable.tunnels[action] = tuple(steps)
+        return tunnel
+
+    @staticmethod
+    def get_next_step(step: Action, lead: Cell, back: Cell, ahead: Cell) -> Action | None:
+        positions = Location.positions
+        if isinstance(step, Move):
+            candidates = ActionTable.get_moves(step.agt, positions[lead])
+        elif isinstance(step, Push):
+            candidates = ActionTable.get_box_actions(step.agt, step.box, positions[back], positions[lead])[0]
+        else:
+            candidates = ActionTable.get_box_actions(step.agt, step.box, positions[lead], positions[back])[1]
+        for candidate in candidates:
+            if candidate.enter_cell == ahead and not candidate.enters_dead:
+                return candidate
+        return None
+
+    @staticmethod
+    def get_macro(action: Action, steps: int) -> Macro:
+        """
+        Macro of action followed by the first steps of its tunnel.
+        """
+        key = (action, steps)
+        macro = ActionTable.macros.get(key)
+        if macro is None:
+            macro = ActionTable.macros[key] = Macro((action, *ActionTable.get_tunnel(action)[:steps]))
+        return macro
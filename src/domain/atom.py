@@ -4,6 +4,7 @@ from src.domain.domain_types import *
 from functools import cache
 
 IGNORE_BITS_MASK = ~(0xFFF << 40)
+ZOBRIST_MASK = 0xFFFF_FFFF_FFFF_FFFF
 
 def encode_agent(loc: Tuple[int, int], agt) -> Atom:
     return encode_atom(AtomType.AGENT_AT, loc[0], loc[1], agt)
@@ -97,10 +98,8 @@ def eval_neighbour(loc1: PosIn, loc2: PosIn) -> bool:
     )  # Both numbers come from abs, otherwise this check would be insufficient.
 
 
-def eval_free(loc: PosIn, literals: LiteralList):
-    loc_int = encode_pos(*loc)
-    x_at_locations = {lit & 0xFFFF_FFFF for lit_type in literals for lit in lit_type}
-    return loc_int not in x_at_locations
+def eval_free(cell: Cell, occupancy: bytearray):
+    return not occupancy[cell]
 
 def atoms_by_type(literals: LiteralList, kind: AtomType) -> dict[int, Pos]:
     return {get_atom_id(lit): Pos(*get_atom_location(lit)) for lit in literals[kind]}
@@ -109,4 +108,22 @@ def get_box_dict(literals: LiteralList, kind: AtomType) -> dict[Box, Pos]:
     return {get_box(lit): Pos(*get_atom_location(lit)) for lit in literals[kind]}
 
 def get_goal_dict(literals: set[Atom]):
-    return {lit & IGNORE_BITS_MASK for lit in literals}
\ No newline at end of file
+    return {lit & IGNORE_BITS_MASK for lit in literals}
+
+@cache
+def zobrist_key(encoded: Atom) -> int:
+    """
+    Pseudo-random 64-bit key of an atom used for Zobrist hashing of states.
+    The key is derived from the atom itself (splitmix64 finalizer), so it is the same in every process.
+    """
+    z = (encoded + 0x9E37_79B9_7F4A_7C15) & ZOBRIST_MASK
+    z = ((z ^ (z >> 30)) * 0xBF58_476D_1CE4_E5B9) & ZOBRIST_MASK
+    z = ((z ^ (z >> 27)) * 0x94D0_49BB_1331_11EB) & ZOBRIST_MASK
+    return z ^ (z >> 31)
+
+def zobrist_hash(literals: LiteralList) -> int:
+    _hash = 0
+    for lit_type in literals:
+        for lit in lit_type:
+            _hash ^= zobrist_key(lit)
+    return _hash
\ No newline at end of file
@@ -0,0 +1,130 @@
+from collections import deque
+
+from src.domain.domain_types import *
+from src.domain.location import Location
+
+
+class Deadlocks:
+    """
+    Static deadlock analysis of the current level, used to prune box actions during successor generation.
+
+    A cell is dead for a box letter if a box of that letter standing there can never reach a goal of the
+    letter. A box moves from b to a neighbour n by a push (the agent stands at another neighbour of b) or
+    a pull (the agent stands at n and steps on to another neighbour of n), so the dead cells follow from a
+    reverse flood fill from the goal cells over those moves.
+
+    Boxes that are frozen in the initial state (no push or pull possible, with walls and the other frozen
+    boxes as the only obstacles) stay where they are and are treated as walls. Freezes cannot arise later:
+    every push is undone by a pull into the cell the agent left, and every pull by a push, so a box that
+    was just moved can always be moved again.
+
+    Letters with more boxes than goals may give up the surplus boxes, a box of such a letter may enter a
+    dead cell as long as enough boxes of the letter remain outside of dead cells (see State.get_applicable_actions).
+    """
+    dead_cells: dict[int, bytearray] = {}  # Box letter -> 1 for every dead cell
+    surplus: dict[int, int] = {}  # Box letter -> number of boxes that are not needed for a goal
+    letter_boxes: dict[int, list[int]] = {}  # Box letter -> indices of its boxes (see State.box_order)
+    frozen_cells: bytearray = bytearray()
+
+    @staticmethod
+    def reset(box_order: list[Box], box_cells: CellList, box_goal_letters: dict[Cell, int]):
+        walls = Location.wall_cells
+        Deadlocks.letter_boxes = {}
+        for i, box in enumerate(box_order):
+            Deadlocks.letter_boxes.setdefault(box[0], []).append(i)
+        Deadlocks.frozen_cells = Deadlocks.find_frozen_cells(box_cells)
+        blocked = bytearray(a | b for a, b in zip(walls, Deadlocks.frozen_cells))
+        open_neighbours = [
+            [] if blocked[cell] else [n for n in Deadlocks.neighbour_cells(cell) if not blocked[n]]
+            for cell in range(len(blocked))
+        ]
+
+        goal_cells: dict[int, list[Cell]] = {}
+        for cell, letter in box_goal_letters.items():
+            goal_cells.setdefault(letter, []).append(cell)
+        Deadlocks.dead_cells = {}
+        Deadlocks.surplus = {}
+        for letter, boxes in Deadlocks.letter_boxes.items():
+            if letter not in goal_cells:
+                continue
+            Deadlocks.dead_cells[letter] = Deadlocks.reverse_reachability(goal_cells[letter], blocked, open_neighbours)
+            Deadlocks.surplus[letter] = len(boxes) - len(goal_cells[letter])
+
+    @staticmethod
+    def neighbour_cells(cell: Cell) -> list[Cell]:
+        return [Location.cell(neighbour) for neighbour in Location.get_neighbours(Location.positions[cell])]
+
+    @staticmethod
+    def reverse_reachability(goal_cells: list[Cell], blocked: bytearray, open_neighbours: list[list[Cell]]) -> bytearray:
+        """
+        Dead cells of a letter: cells that are not blocked and from which no unblocked goal cell is reachable.
+        """
+        live = bytearray(len(blocked))
+        queue = deque(cell for cell in goal_cells if not blocked[cell])
+        for cell in queue:
+            live[cell] = 1
+        while queue:
+            n = queue.popleft()
+            for b in open_neighbours[n]:
+                # b -> n by a push (agent at another neighbour of b) or a pull (agent leaves n to another cell)
+                if not live[b] and (len(open_neighbours[b]) >= 2 or len(open_neighbours[n]) >= 2):
+                    live[b] = 1
+                    queue.append(b)
+        return bytearray(not (live[cell] or blocked[cell]) for cell in range(len(blocked)))
+
+    @staticmethod
+    def find_frozen_cells(box_cells: CellList) -> bytearray:
+        """
+        Cells of the boxes that can never move: the largest set of boxes in which no box can be pushed or
+        pulled while the walls and the other boxes of the set stay in place.
+        """
+        walls = Location.wall_cells
+        frozen = bytearray(len(walls))
+        for cell in box_cells:
+            frozen[cell] = 1
+
+        def is_open(cell: Cell) -> bool:
+            return not (walls[cell] or frozen[cell])
+
+        def can_move(cell: Cell) -> bool:
+            neighbours = [n for n in Deadlocks.neighbour_cells(cell) if is_open(n)]
+            if len(neighbours) >= 2:
+                return True  # Push from one neighbour into another
+            # Pull into the only neighbour, the agent steps on from there
+            return any(is_open(m) and m != cell for n in neighbours for m in Deadlocks.neighbour_cells(n))
+
+        changed = True
+        while changed:
+            changed = False
+            for cell in box_cells:
+                if frozen[cell] and can_move(cell):
+                    frozen[cell] = 0
+                    changed = True
+        return frozen
+
+    @staticmethod
+    def is_dead(letter: int, cell: Cell) -> bool:
+        dead_cells = Deadlocks.dead_cells.get(letter)
+        return dead_cells is not None and bool(dead_cells[cell])
+
+    @staticmethod
+    def classify(letter: int, boxfrom_cell: Cell, boxto_cell: Cell) -> tuple[bool, bool]:
+        """
+        (pruned, enters_dead) of a box action: pruned actions move a box of a letter without surplus boxes
+        into a dead cell and are never generated, enters_dead marks the moves of surplus boxes from a live
+        into a dead cell, which are only allowed while the letter has boxes to spare.
+        """
+        if not Deadlocks.is_dead(letter, boxto_cell) or Deadlocks.is_dead(letter, boxfrom_cell):
+            return False, False
+        if Deadlocks.surplus[letter] <= 0:
+            return True, False
+        return False, True
+
+    @staticmethod
+    def spare_boxes(letter: int, box_cells: CellList) -> int:
+        """
+        Number of boxes of letter that may still enter a dead cell in a state.
+        """
+        dead_cells = Deadlocks.dead_cells[letter]
+        dead_boxes = sum(1 for i in Deadlocks.letter_boxes[letter] if dead_cells[box_cells[i]])
+        return Deadlocks.surplus[letter] - dead_boxes
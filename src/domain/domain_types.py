@@ -1,11 +1,14 @@
+from array import array
 from typing import NamedTuple, Tuple
 
 
 Atom = int #Making it easiet to spot the encoded literal
+Cell = int #Dense cell id, see Location.cell
 Box = Tuple[int, int]
 Pos = NamedTuple("Pos", [("row", int), ("col", int)])
 PosIn = Pos | Tuple[int, int]
 LiteralList = Tuple[set[Atom]]
 GoalLiteralList = Tuple[list[Atom]]
+CellList = array #array('H') of cells, indexed by agent or box index
 
 def LiteralList_new(): return (set(), set())
\ No newline at end of file
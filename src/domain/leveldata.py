@@ -1,5 +1,7 @@
 import sys
 
+import numpy as np
+
 class LevelData:
     """
     The object contains string representations of the level and colors.\n
@@ -144,72 +146,90 @@ class LevelData:
         self.string_goal = [''.join(row) for row in self.goal]
 
     # region flood fill
-    def flood_fill(self, start, grid):
-        x_size, y_size = len(grid[0]), len(grid)
-        stack = [start]
-        filled = set()
-        region = []
-
-        while stack:
-            x, y = stack.pop()
-            if (x, y) in filled or grid[y][x] == '+':
-                continue
-            filled.add((x, y))
-            region.append((x, y))
-
-            for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < x_size and 0 <= ny < y_size and grid[ny][nx] != '+':
-                    stack.append((nx, ny))
-
-        return region
+    @staticmethod
+    def label_regions(free: np.ndarray) -> np.ndarray:
+        """
+        Connected components of the free cells of a grid, as an array of the grid's shape holding the smallest
+        cell of the component of every free cell and -1 for walls. Vectorized union-find over the pairs of free
+        neighbours: the roots of every pair are linked to the smaller one, then all paths are compressed,
+        until both cells of every pair have the same root.
+        """
+        cells = np.arange(free.size).reshape(free.shape)
+        horizontal = free[:, :-1] & free[:, 1:]
+        vertical = free[:-1, :] & free[1:, :]
+        a = np.concatenate([cells[:, :-1][horizontal], cells[:-1, :][vertical]])
+        b = np.concatenate([cells[:, 1:][horizontal], cells[1:, :][vertical]])
+
+        parent = cells.ravel().copy()
+        while True:
+            root_a, root_b = parent[a], parent[b]
+            linked = root_a != root_b
+            if not linked.any():
+                break
+            # The roots only ever point to smaller cells, so no cycles are created
+            np.minimum.at(parent, np.maximum(root_a, root_b)[linked], np.minimum(root_a, root_b)[linked])
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+
+        labels = parent.reshape(free.shape)
+        labels[~free] = -1
+        return labels
 
     def segment_regions(self):
-        visited = set()
-        regions = []
+        """
+        Split the level into its connected regions (see label_regions) that contain goals.
+        Every region is returned as a level cropped to the region's bounding box (with a wall border).
+        """
+        initial = np.array(self.initial, dtype="<U1")
+        goal = np.array(self.goal, dtype="<U1")
+        labels = LevelData.label_regions(initial != '+')
+
+        free_cells = np.flatnonzero(labels >= 0)
+        region_labels = labels.ravel()[free_cells]
+        order = np.argsort(region_labels, kind="stable")
+        free_cells, region_labels = free_cells[order], region_labels[order]
+        starts = np.flatnonzero(np.r_[True, region_labels[1:] != region_labels[:-1]])
 
-        for y in range(len(self.initial)):
-            for x in range(len(self.initial[0])):
-                if self.initial[y][x] != '+' and (x, y) not in visited:
-                    region = self.flood_fill((x, y), self.initial)
-                    region_goals = {}
-                    for rx, ry in region:
-                        goal = self.goal[ry][rx]
-                        if goal.isdigit() or goal.isalpha():
-                            region_goals[goal] = region_goals.get(goal, 0) + 1
-                    if region_goals:
-                        regions.append((region, region_goals))
-                    visited.update(region)
-
-        return self.create_level_data_from_regions(regions)
-
-    def create_level_data_from_regions(self, regions):
+        regions = []
+        for region_cells in np.split(free_cells, starts[1:]):
+            rows, cols = np.divmod(region_cells, initial.shape[1])
+            region_goals = {}
+            for cell_goal in goal[rows, cols].tolist():
+                if cell_goal.isdigit() or cell_goal.isalpha():
+                    region_goals[cell_goal] = region_goals.get(cell_goal, 0) + 1
+            if region_goals:
+                regions.append((labels.ravel()[region_cells[0]], rows, cols, region_goals))
+
+        return self.create_level_data_from_regions(regions, initial, goal, labels)
+
+    def create_level_data_from_regions(self, regions, initial: np.ndarray, goal: np.ndarray, labels: np.ndarray):
         new_levels = []
+        num_rows, num_cols = initial.shape
 
-        for region, region_goals in regions:
-            new_initial = [['+' for _ in range(len(self.initial[0]))] for _ in range(len(self.initial))]
-            new_goal = [['+' for _ in range(len(self.goal[0]))] for _ in range(len(self.goal))]
-            new_colors = {}
+        for label, rows, cols, region_goals in regions:
+            top, left = max(rows.min() - 1, 0), max(cols.min() - 1, 0)
+            bottom, right = min(rows.max() + 2, num_rows), min(cols.max() + 2, num_cols)
+            in_region = labels[top:bottom, left:right] == label
+            new_initial = np.where(in_region, initial[top:bottom, left:right], '+')
+            new_goal = np.where(in_region, goal[top:bottom, left:right], '+')
 
-            for x, y in region:
-                new_initial[y][x] = self.initial[y][x]
-                new_goal[y][x] = self.goal[y][x]
-                element = self.initial[y][x]
-                if element.isdigit() or element.isalpha():
-                    for color, items in self.colors.items():
-                        if element in items:
-                            if color not in new_colors:
-                                new_colors[color] = []
-                            new_colors[color].append(element)
-
-            if any(cell != '+' for row in new_goal for cell in row):  # Ensure there are goals in the region
-                level = LevelData(
-                    initial=new_initial,
-                    goal=new_goal,
-                    colors=new_colors
-                )
-                level.goals_list = region_goals  # Assign local goals to the specific region level
-                new_levels.append(level)
+            elements = set(new_initial[in_region].tolist())
+            new_colors = {}
+            for color, items in self.colors.items():
+                region_items = [item for item in dict.fromkeys(items) if item in elements]
+                if region_items:
+                    new_colors[color] = region_items
+
+            level = LevelData(
+                initial=new_initial.tolist(),
+                goal=new_goal.tolist(),
+                colors=new_colors
+            )
+            level.goals_list = region_goals  # Assign local goals to the specific region level
+            new_levels.append(level)
 
         return new_levels
     # endregion flood fill
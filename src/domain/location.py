@@ -4,6 +4,9 @@ from src.domain.domain_types import *
 class Location:
     all_neighbours: np.ndarray  # Use a 3D numpy array to store neighbour positions.
     walls: np.ndarray
+    width: int = 0
+    positions: list[Pos] = []  # Dense cell id -> position, see Location.cell
+    wall_cells: bytearray = bytearray()  # Occupancy template, 1 for every wall cell
 
     @staticmethod
     def init_arrays(height: int, width: int):
@@ -40,8 +43,18 @@ class Location:
         row, col = loc
         return list[Pos](Location.all_neighbours[row, col])
 
+    @staticmethod
+    def cell(loc: PosIn) -> Cell:
+        """
+        Dense id of a cell (row-major index into Location.walls), used by the compact state representation.
+        """
+        return loc[0] * Location.width + loc[1]
+
     @staticmethod
     def calculate_all_neighbours(walls: list[list[bool]]):
         Location.init_arrays(len(walls), len(walls[0]))
         Location.walls = np.array(walls, dtype=bool)
+        Location.width = len(walls[0])
+        Location.positions = [Pos(row, col) for row in range(len(walls)) for col in range(len(walls[0]))]
+        Location.wall_cells = bytearray(Location.walls.tobytes())
         Location.calculate_neighbours()
\ No newline at end of file
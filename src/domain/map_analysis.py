@@ -0,0 +1,149 @@
+import numpy as np
+
+from src.domain.domain_types import *
+from src.domain.location import Location
+
+NO_CHOKE_POINT = -1  # Label of walls and of cells that are not part of the labelled structure
+
+
+class MapAnalysis:
+    """
+    Structure of the free-cell graph of the current level, built once per level (see reset) without recursion.
+    All arrays are indexed by dense cell id (see Location.cell):
+
+    - degree: number of free neighbours
+    - articulation: True for the cells whose removal disconnects the free cells (Tarjan's algorithm)
+    - block: biconnected component of a cell, NO_CHOKE_POINT for articulation cells (they join several)
+    - corridor: maximal chain of cells with at most two free neighbours, NO_CHOKE_POINT elsewhere
+    - room: connected area of cells with more than two free neighbours, NO_CHOKE_POINT elsewhere
+
+    corridor_length and room_size hold the number of cells of every corridor and room.
+    """
+    degree: np.ndarray = np.zeros(0, dtype=np.int8)
+    articulation: np.ndarray = np.zeros(0, dtype=bool)
+    block: np.ndarray = np.zeros(0, dtype=np.int32)
+    corridor: np.ndarray = np.zeros(0, dtype=np.int32)
+    room: np.ndarray = np.zeros(0, dtype=np.int32)
+    corridor_length: np.ndarray = np.zeros(0, dtype=np.int32)
+    room_size: np.ndarray = np.zeros(0, dtype=np.int32)
+
+    @staticmethod
+    def reset():
+        num_cells = Location.walls.size
+        free_cells = np.flatnonzero(~Location.walls).tolist()
+        neighbours: list[list[Cell]] = [[] for _ in range(num_cells)]
+        for cell in free_cells:
+            neighbours[cell] = [Location.cell(n) for n in Location.get_neighbours(Location.positions[cell])]
+
+        MapAnalysis.degree = np.array([len(n) for n in neighbours], dtype=np.int8)
+        articulation, block = MapAnalysis.biconnected_components(free_cells, neighbours)
+        MapAnalysis.articulation = np.array(articulation, dtype=bool)
+        MapAnalysis.block = np.array(block, dtype=np.int32)
+
+        narrow = MapAnalysis.degree <= 2
+        MapAnalysis.corridor, MapAnalysis.corridor_length = MapAnalysis.label(
+            [cell for cell in free_cells if narrow[cell]], neighbours, narrow
+        )
+        MapAnalysis.room, MapAnalysis.room_size = MapAnalysis.label(
+            [cell for cell in free_cells if not narrow[cell]], neighbours, ~narrow
+        )
+
+    @staticmethod
+    def biconnected_components(free_cells: list[Cell], neighbours: list[list[Cell]]) -> tuple[list[bool], list[int]]:
+        """
+        Tarjan's algorithm with an explicit stack. Returns the articulation flag and the block of every cell.
+        """
+        num_cells = len(neighbours)
+        discovery = [-1] * num_cells
+        low = [0] * num_cells
+        articulation = [False] * num_cells
+        block = [NO_CHOKE_POINT] * num_cells
+        edges: list[tuple[Cell, Cell]] = []
+        num_blocks = 0
+        time = 0
+
+        for root in free_cells:
+            if discovery[root] >= 0:
+                continue
+            discovery[root] = low[root] = time
+            time += 1
+            if not neighbours[root]:
+                block[root] = num_blocks
+                num_blocks += 1
+                continue
+
+            root_children = 0
+            stack = [(root, -1, iter(neighbours[root]))]
+            while stack:
+                cell, parent, remaining = stack[-1]
+                descended = False
+                for neighbour in remaining:
+                    if discovery[neighbour] < 0:
+                        edges.append((cell, neighbour))
+                        discovery[neighbour] = low[neighbour] = time
+                        time += 1
+                        stack.append((neighbour, cell, iter(neighbours[neighbour])))
+                        descended = True
+                        break
+                    if neighbour != parent and discovery[neighbour] < discovery[cell]:
+                        edges.append((cell, neighbour))
+                        low[cell] = min(low[cell], discovery[neighbour])
+                if descended:
+                    continue
+
+                stack.pop()
+                if not stack:
+                    break
+                if low[cell] < low[parent]:
+                    low[parent] = low[cell]
+                if parent == root:
+                    root_children += 1
+                if low[cell] >= discovery[parent]:
+                    # parent separates the subtree of cell: the edges above (parent, cell) form a block
+                    if parent != root:
+                        articulation[parent] = True
+                    while True:
+                        a, b = edges.pop()
+                        block[a] = block[b] = num_blocks
+                        if (a, b) == (parent, cell):
+                            break
+                    num_blocks += 1
+            if root_children > 1:
+                articulation[root] = True
+
+        for cell in free_cells:
+            if articulation[cell]:
+                block[cell] = NO_CHOKE_POINT
+        return articulation, block
+
+    @staticmethod
+    def label(cells: list[Cell], neighbours: list[list[Cell]], member: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Connected components of cells (flood fill over neighbours that are members), and their sizes.
+        """
+        member = member.tolist()
+        labels = [NO_CHOKE_POINT] * len(neighbours)
+        sizes = []
+        for start in cells:
+            if labels[start] != NO_CHOKE_POINT:
+                continue
+            component = len(sizes)
+            labels[start] = component
+            stack = [start]
+            size = 0
+            while stack:
+                cell = stack.pop()
+                size += 1
+                for neighbour in neighbours[cell]:
+                    if member[neighbour] and labels[neighbour] == NO_CHOKE_POINT:
+                        labels[neighbour] = component
+                        stack.append(neighbour)
+            sizes.append(size)
+        return np.array(labels, dtype=np.int32), np.array(sizes, dtype=np.int32)
+
+    @staticmethod
+    def grid(values: np.ndarray) -> np.ndarray:
+        """
+        A per-cell array as a (rows, cols) view.
+        """
+        return values.reshape(Location.walls.shape)
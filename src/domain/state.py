@@ -1,48 +1,175 @@
+from array import array
+from collections.abc import Mapping
 from itertools import chain
 import random
+import sys
 
 from src.domain.location import Location
-from src.domain.atom import get_goal_dict, AtomType, atoms_by_type, atom_repr, encode_box, get_box_dict, atom_repr
-from src.domain.action import Action, Move, Pull, Push
+from src.domain.atom import AtomType, atoms_by_type, atom_repr, encode_agent, encode_box, get_atom_id, get_atom_location, get_atom_type, get_box_dict, zobrist_hash
+from src.domain.action import Action, ActionTable, Macro, Pull, Push
+from src.domain.deadlock import Deadlocks
+from src.domain.map_analysis import MapAnalysis
 
-from typing import Optional, Self
+from typing import Iterator, Self
 
 from src.domain.domain_types import *
 from src.utils.level_parser import Parser
 
+class AgentLocations(Mapping):
+    """
+    Read-only agent -> Pos view over the agent cells of a state.
+    """
+    __slots__ = ("cells",)
+
+    def __init__(self, cells: CellList):
+        self.cells = cells
+
+    def __getitem__(self, agent: int) -> Pos:
+        if not 0 <= agent < len(self.cells):
+            raise KeyError(agent)
+        return Location.positions[self.cells[agent]]
+
+    def __iter__(self):
+        return iter(range(len(self.cells)))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def items(self):
+        positions = Location.positions
+        return ((agent, positions[cell]) for agent, cell in enumerate(self.cells))
+
+
+class BoxLocations(Mapping):
+    """
+    Read-only box -> Pos view over the box cells of a state, ordered by State.box_order.
+    """
+    __slots__ = ("cells",)
+
+    def __init__(self, cells: CellList):
+        self.cells = cells
+
+    def __getitem__(self, box: Box) -> Pos:
+        return Location.positions[self.cells[State.box_index[box]]]
+
+    def __iter__(self):
+        return iter(State.box_order)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def items(self):
+        positions = Location.positions
+        return ((box, positions[cell]) for box, cell in zip(State.box_order, self.cells))
+
+
 class State:
+    """
+    Compact search node. Agents and boxes are stored as array('H') of dense cell ids
+    (see Location.cell), indexed by agent number and by State.box_order respectively.
+    The dict/set based API (agent_locations, box_locations, literals) is provided through views.
+    """
+    __slots__ = (
+        "agent_cells",
+        "box_cells",
+        "parent",
+        "joint_action",
+        "g",
+        "h",
+        "h_terms",
+        "_goals_satisfied",
+        "_subgoals_satisfied",
+        "_subgoals_version",
+        "_hash",
+        "_occupancy",
+        "_box_at",
+    )
+
     _RNG = random.Random(1)
     agent_colors = []
     box_colors = []
     agent_box_dict = {}
     goal_literals: GoalLiteralList = LiteralList_new()
-
-    def __init__(self, literals: LiteralList):
-        self.literals: LiteralList = literals
-        self._agent_locations: dict[Atom, Pos] = None
-        self._box_locations: dict[Box, Pos] = None
+    box_order: list[Box] = []
+    box_index: dict[Box, int] = {}
+    operator_decomposition: bool = False
+    macro_actions: bool = False  # Agents run through tunnels in a single step, see take_tunnels
+    # Goal lookup for the incremental goal counter: goal cell of every agent (-1 if none), box letter of every box goal cell
+    agent_goal_cells: list[Cell] = []
+    box_goal_letters: dict[Cell, int] = {}
+    goal_count = 0
+    # The same lookups for the subgoals of SIW (see set_subgoals), version 0 while there are none
+    subgoal_agent_cells: list[Cell] = []
+    subgoal_box_letters: dict[Cell, int] = {}
+    subgoal_count = 0
+    subgoal_version = 0
+    _subgoal_versions = 0
+
+    def __init__(self, agent_cells: CellList, box_cells: CellList):
+        self.agent_cells: CellList = agent_cells
+        self.box_cells: CellList = box_cells
         self.parent = None
-        self.joint_action = None
+        self.joint_action: list[Action] = None
         self.g = 0
+        self.h: int | float = None  # Cached heuristic value, see Heuristic.evaluate
+        self.h_terms = None  # Heuristic terms, only set while the children are evaluated, see HeuristicComplexDijkstra
+        self._goals_satisfied: int = None
+        self._subgoals_satisfied = 0
+        self._subgoals_version = 0
         self._hash = None
+        self._occupancy: bytearray = None
+        self._box_at: dict[Cell, int] = None
+
+    @property
+    def agent_locations(self) -> AgentLocations:
+        return AgentLocations(self.agent_cells)
 
-        agent_locations_length = len(self.literals[AtomType.AGENT_AT])
-        self.lastMovedBox: list[Box] = [None] * agent_locations_length
-        self.recalculateDistanceOfBox: list[Box] = [None] * agent_locations_length
+    @property
+    def box_locations(self) -> BoxLocations:
+        return BoxLocations(self.box_cells)
+
+    @property
+    def literals(self) -> LiteralList:
+        positions = Location.positions
+        return (
+            {encode_agent(positions[cell], agent) for agent, cell in enumerate(self.agent_cells)},
+            {encode_box(positions[cell], box) for box, cell in zip(State.box_order, self.box_cells)},
+        )
 
-        self.lastActions:list[Action] = None
-    
     @property
-    def agent_locations(self):
-        if self._agent_locations is None:
-            self._agent_locations = atoms_by_type(self.literals, AtomType.AGENT_AT)
-        return self._agent_locations
-    
+    def occupancy(self) -> bytearray:
+        """
+        Byte per cell of Location.walls, non-zero if the cell holds a wall, an agent or a box.
+        Built lazily for states that get expanded and released again afterwards.
+        """
+        if self._occupancy is None:
+            occupancy = Location.wall_cells[:]
+            for cell in chain(self.agent_cells, self.box_cells):
+                occupancy[cell] = 1
+            self._occupancy = occupancy
+        return self._occupancy
+
+    @property
+    def box_at(self) -> dict[Cell, int]:
+        """
+        Cell -> index (into State.box_order) of the box standing there. Like the occupancy grid,
+        it is only built for states that get expanded.
+        """
+        if self._box_at is None:
+            self._box_at = {cell: i for i, cell in enumerate(self.box_cells)}
+        return self._box_at
+
     @property
-    def box_locations(self):
-        if self._box_locations is None:
-            self._box_locations = get_box_dict(self.literals, AtomType.BOX_AT)
-        return self._box_locations
+    def lastActions(self) -> list[Action]:
+        return self.joint_action
+
+    @staticmethod
+    def from_literals(literals: LiteralList) -> Self:
+        agent_locations = atoms_by_type(literals, AtomType.AGENT_AT)
+        box_locations = get_box_dict(literals, AtomType.BOX_AT)
+        agent_cells = array("H", (Location.cell(agent_locations[agent]) for agent in range(len(agent_locations))))
+        box_cells = array("H", (Location.cell(box_locations[box]) for box in State.box_order))
+        return State(agent_cells, box_cells)
 
     @staticmethod
     def make_initial_state(leveldata):
@@ -66,179 +193,457 @@ class State:
         goal_literals, goal_literals_to_check, goal_boxes_dict = Parser.read_goal_state(leveldata)
         State.boxes = boxes_dict
         State.boxgoals = goal_boxes_dict
+        State.box_order = [box for boxes in boxes_dict.values() for box in boxes]
+        State.box_index = {box: i for i, box in enumerate(State.box_order)}
 
         State.goal_literals = goal_literals
         State.goal_literals_to_check = goal_literals_to_check
-        return State(literals)
-
-    def result(self, joint_action: list[Action], copy_literals: Optional[LiteralList] = None) -> Self:
-        calc_results = False
-        if copy_literals is None:
-            calc_results = True
-            copy_literals = (set(self.literals[0]), set(self.literals[1]))
-
-        copy_recalculateDistanceOfBox = self.recalculateDistanceOfBox[:]
-        copy_lastMovedBox = self.lastMovedBox[:]
-        for agent, action in enumerate(joint_action):
-            if calc_results: 
-                copy_literals = action.apply_effects(copy_literals)
-            
-            if isinstance(action, Move) and copy_lastMovedBox[agent] is not None:
-                copy_recalculateDistanceOfBox[agent] = copy_lastMovedBox[agent]
-                copy_lastMovedBox[agent] = None
-            elif getattr(action, 'box', None) is not None:
-                copy_lastMovedBox[agent] = action.box
-            
-        copy_state = State(copy_literals)
+        State.agent_goal_cells = [-1] * len(agent_locations)
+        State.box_goal_letters = {}
+        for atom_type, cell, label in State.decode_goals(goal_literals_to_check[AtomType.AGENT_AT] + goal_literals_to_check[AtomType.BOX_AT]):
+            if atom_type == AtomType.AGENT_AT:
+                if label >= len(State.agent_goal_cells):
+                    # The goal stays in goal_count, so the level is reported as unsolvable
+                    print(f"Goal of agent {label}, which is not in the level.", file=sys.stderr, flush=True)
+                    continue
+                State.agent_goal_cells[label] = cell
+            else:
+                State.box_goal_letters[cell] = label
+        State.goal_count = len(goal_literals_to_check[AtomType.AGENT_AT]) + len(goal_literals_to_check[AtomType.BOX_AT])
+        ActionTable.reset(len(agent_locations), {cell for cell in State.agent_goal_cells if cell >= 0} | State.box_goal_letters.keys())
+        MapAnalysis.reset()
+        initial_state = State.from_literals(literals)
+        Deadlocks.reset(State.box_order, initial_state.box_cells, State.box_goal_letters)
+        return initial_state
+
+    def result(self, joint_action: list[Action], skip_check: bool = False, state_type: type = None) -> Self:
+        """
+        Apply a joint action, with skip_check the joint action must already be known to be conflict free
+        (see get_joint_actions) and the preconditions are not evaluated again.
+        """
+        copy_agent_cells = self.agent_cells[:]
+        copy_box_cells = self.box_cells[:]
+        copy_occupancy = None if skip_check else self.occupancy[:]
+
+        copy_hash = self.zobrist
+        copy_goals_satisfied = self.goals_satisfied
+        agent_goal_cells, box_goal_letters = State.agent_goal_cells, State.box_goal_letters
+        subgoal_version = State.subgoal_version
+        if subgoal_version:
+            copy_subgoals_satisfied = self.subgoals_satisfied
+            subgoal_agent_cells, subgoal_box_letters = State.subgoal_agent_cells, State.subgoal_box_letters
+        for action in joint_action:
+            action.apply_effects(copy_agent_cells, copy_box_cells, copy_occupancy, skip_check)
+            copy_hash ^= action.hash_delta()
+            copy_goals_satisfied += action.goal_delta(agent_goal_cells, box_goal_letters)
+            if subgoal_version:
+                copy_subgoals_satisfied += action.goal_delta(subgoal_agent_cells, subgoal_box_letters)
+
+        copy_state = (state_type or State)(copy_agent_cells, copy_box_cells)
         copy_state.parent = self
         copy_state.joint_action = joint_action[:]
-        copy_state.g = self.g + 1
-        copy_state.recalculateDistanceOfBox = copy_recalculateDistanceOfBox
-        copy_state.lastMovedBox = copy_lastMovedBox
-
-        copy_state.lastActions = joint_action
+        copy_state.g = self.g + (max(action.length for action in joint_action) if State.macro_actions else 1)
+        copy_state._hash = copy_hash
+        copy_state._goals_satisfied = copy_goals_satisfied
+        if subgoal_version:
+            copy_state._subgoals_satisfied = copy_subgoals_satisfied
+            copy_state._subgoals_version = subgoal_version
 
         return copy_state
 
-    def is_goal_state(self, g: int = None) -> bool:
-        # Remove unique box_id as only the color matters
-        for goal_type in [AtomType.AGENT_AT, AtomType.BOX_AT]:
-            masked_literals = get_goal_dict(self.literals[goal_type])
-            for goal in self.goal_literals_to_check[goal_type][:g]:
-                if goal not in masked_literals:
-                    return False
-        return True
+    @property
+    def goals_satisfied(self) -> int:
+        # Number of satisfied goals, updated incrementally in result()
+        if self._goals_satisfied is None:
+            self._goals_satisfied = self.count_goals(State.agent_goal_cells, State.box_goal_letters)
+        return self._goals_satisfied
+
+    @property
+    def subgoals_satisfied(self) -> int:
+        # Number of satisfied subgoals, updated incrementally in result() and counted again for states
+        # created before the last set_subgoals()
+        if self._subgoals_version != State.subgoal_version:
+            self._subgoals_satisfied = self.count_goals(State.subgoal_agent_cells, State.subgoal_box_letters)
+            self._subgoals_version = State.subgoal_version
+        return self._subgoals_satisfied
+
+    def count_goals(self, agent_goal_cells: list[Cell], box_goal_letters: dict[Cell, int]) -> int:
+        agent_cells = self.agent_cells
+        count = sum(1 for agent, cell in enumerate(agent_goal_cells) if agent_cells[agent] == cell)
+        for box, cell in enumerate(self.box_cells):
+            if box_goal_letters.get(cell) == State.box_order[box][0]:
+                count += 1
+        return count
+
+    def is_goal_state(self) -> bool:
+        return self.goals_satisfied == State.goal_count
+
+    @staticmethod
+    def decode_goals(goals: list[Atom]) -> list[tuple[int, Cell, int]]:
+        """
+        (atom type, cell, agent number or box letter) of goal atoms, see set_subgoals().
+        """
+        return [(get_atom_type(goal), Location.cell(get_atom_location(goal)), get_atom_id(goal)) for goal in goals]
+
+    @staticmethod
+    def set_subgoals(goals: list[tuple[int, Cell, int]] | None):
+        """
+        Decoded goals tested by satisfies_subgoals() from now on, None when there are none. Goals of agents
+        that are not in the level are never satisfied (see make_initial_state).
+        """
+        State.subgoal_agent_cells = [-1] * len(State.agent_goal_cells)
+        State.subgoal_box_letters = {}
+        State.subgoal_count = 0
+        State.subgoal_version = 0
+        if goals is None:
+            return
+        for atom_type, cell, label in goals:
+            if atom_type == AtomType.AGENT_AT:
+                if label < len(State.subgoal_agent_cells):
+                    State.subgoal_agent_cells[label] = cell
+            else:
+                State.subgoal_box_letters[cell] = label
+        State.subgoal_count = len(goals)
+        State._subgoal_versions += 1
+        State.subgoal_version = State._subgoal_versions
+
+    def satisfies_subgoals(self) -> bool:
+        return self.subgoals_satisfied == State.subgoal_count
+
+    def count_unsatisfied_goals(self) -> int:
+        return State.goal_count - self.goals_satisfied
 
     def get_expanded_states(self) -> list[Self]:
-        num_agents = len(self.agent_locations)
+        return [successor.materialize() for successor in self.get_successors()]
+
+    def get_successors(self) -> list["Successor | State"]:
+        """
+        Successors of this state as handles, the child States are only built when materialized.
+        The handles already carry the child's Zobrist key, so duplicates can be rejected before that.
+        """
+        num_agents = len(self.agent_cells)
+        if State.operator_decomposition and num_agents > 1:
+            return self.expand_agent(self, [])
 
         # Determine list of applicable action for each individual agent.
         applicable_actions = [self.get_applicable_actions(agent) for agent in range(num_agents)]
+        if State.macro_actions:
+            applicable_actions = [self.take_tunnels(actions) for actions in applicable_actions]
+
+        # Iterate over conflict free joint actions and generate child handles.
+        zobrist = self.zobrist
+        successors = []
+        for joint_action in State.get_joint_actions(applicable_actions):
+            child_hash = zobrist
+            for action in joint_action:
+                child_hash ^= action.hash_delta()
+            successors.append(Successor(self, joint_action[:], child_hash))
+
+        # The occupancy grid and box map are only needed while expanding, don't keep them around in the explored set
+        self._occupancy = None
+        self._box_at = None
+        return successors
 
-        # Iterate over joint actions, check conflict and generate child states.
-        joint_action: list[Action] = [Action(0) for _ in range(num_agents)]
-        actions_permutation = [0] * num_agents
-        expanded_states = []
-        while True:
-            for agent in range(num_agents):
-                joint_action[agent] = applicable_actions[agent][
-                    actions_permutation[agent]
-                ]
-
-            (check, result) = self.is_conflicting(joint_action)
-            if not check:
-                expanded_states.append(self.result(joint_action, result))
-
-            # Advance permutation.
-            done = False
-            for agent in range(num_agents):
-                if actions_permutation[agent] < len(applicable_actions[agent]) - 1:
-                    actions_permutation[agent] += 1
-                    break
+    @staticmethod
+    def get_joint_actions(applicable_actions: list[list[Action]]) -> Iterator[list[Action]]:
+        """
+        Yield every conflict free combination of the agents' applicable actions.
+        Actions are applicable in this state, so a combination conflicts only if two actions enter the
+        same cell (CellConflict) or move the same box (BoxConflict). The cells entered and boxes moved by
+        the agents assigned so far are reserved, and a conflict prunes all combinations of the remaining
+        agents at once. Macros reserve every cell they enter. The yielded list is reused, copy it to keep it
+        (result() does).
+        """
+        num_agents = len(applicable_actions)
+        joint_action: list[Action] = [None] * num_agents
+        reserved_cells: set[Cell] = set()
+        moved_boxes: set[Box] = set()
+
+        def assign(agent: int):
+            if agent == num_agents:
+                yield joint_action
+                return
+            for action in applicable_actions[agent]:
+                cell, box, path_cells = action.enter_cell, action.box, action.path_cells
+                if cell in reserved_cells or box in moved_boxes:
+                    continue
+                if path_cells is not None:
+                    if not reserved_cells.isdisjoint(path_cells):
+                        continue
+                    reserved_cells.update(path_cells)
+                elif cell is not None:
+                    reserved_cells.add(cell)
+                if box is not None:
+                    moved_boxes.add(box)
+                joint_action[agent] = action
+                yield from assign(agent + 1)
+                if path_cells is not None:
+                    reserved_cells.difference_update(path_cells)
                 else:
-                    actions_permutation[agent] = 0
-                    if agent == num_agents - 1:
-                        done = True
+                    reserved_cells.discard(cell)
+                moved_boxes.discard(box)
+
+        return assign(0)
+
+    def expand_agent(self, base: "State", partial_action: list[Action]) -> list["State"]:
+        """
+        Operator decomposition: the successors of this node each assign an action to the next agent.
+        The actions are applicable in base, the full state the current step started from, and must not
+        conflict with the actions already chosen. Assigning the last agent yields full states again.
+        """
+        agent = len(partial_action)
+        last_agent = agent == len(base.agent_cells) - 1
+        reserved_cells = {action.enter_cell for action in partial_action if action.enter_cell is not None}
+        moved_boxes = {action.box for action in partial_action if action.box is not None}
 
-            # Last permutation?
-            if done:
-                break
+        expanded_states = []
+        for action in base.get_applicable_actions(agent):
+            if action.enter_cell in reserved_cells or action.box in moved_boxes:
+                continue
+            joint_action = partial_action + [action]
+            if last_agent:
+                expanded_states.append(base.result(joint_action, skip_check=True))
+            else:
+                expanded_states.append(IntermediateState.create(base, joint_action, self))
 
-        # State._RNG.shuffle(expanded_states)
+        base._occupancy = None
+        base._box_at = None
         return expanded_states
 
     @staticmethod
-    def is_applicable(action: Action, literals: LiteralList) -> bool:
-        return action.check_preconditions(literals)
+    def is_applicable(action: Action, agent_cells: CellList, box_cells: CellList, occupancy: bytearray) -> bool:
+        return action.check_preconditions(agent_cells, box_cells, occupancy)
 
-    def get_applicable_actions(self, agent: int) -> Action:
+    def get_applicable_actions(self, agent: int) -> list[Action]:
         agtfrom = self.agent_locations[agent]
+        occupancy = self.occupancy
+        box_at = self.box_at
+        movable_boxes = State.agent_box_dict[agent]
         possibilities = []
-        agtfrom_neighbours = Location.get_neighbours(agtfrom)
 
         # Move:
-        for agtto in agtfrom_neighbours:
-            action = Move(agent, agtfrom, agtto)
-            if self.is_applicable(action, self.literals):
+        for action in ActionTable.get_moves(agent, agtfrom):
+            if not occupancy[action.agtto_cell]:
                 possibilities.append(action)
 
+        # Pushes and pulls of the neighbouring boxes the agent is allowed to move
+        box_actions = []
+        for boxfrom in Location.get_neighbours(agtfrom):
+            box_index = box_at.get(Location.cell(boxfrom))
+            if box_index is not None:
+                box = State.box_order[box_index]
+                if box[0] in movable_boxes:
+                    box_actions.append(ActionTable.get_box_actions(agent, box, agtfrom, boxfrom))
+
         # Push:
-        for boxfrom in agtfrom_neighbours:
-            boxes = [
-                box
-                for c in State.agent_box_dict[agent]
-                for box in State.boxes[c]
-                if encode_box(boxfrom, box) in self.literals[AtomType.BOX_AT]
-            ]
-            boxfrom_neighbours = Location.get_neighbours(boxfrom)
-            for box in boxes:
-                for boxto in boxfrom_neighbours:
-                    action = Push(agent, agtfrom, box, boxfrom, boxto)
-                    if self.is_applicable(action, self.literals):
-                        possibilities.append(action)
+        for pushes, _ in box_actions:
+            for action in pushes:
+                if not occupancy[action.boxto_cell] and (not action.enters_dead or self.has_spare_box(action.box)):
+                    possibilities.append(action)
 
         # Pull:
-        for boxfrom in agtfrom_neighbours:
-            boxes = [
-                box
-                for c in State.agent_box_dict[agent]
-                for box in State.boxes[c]
-                if encode_box(boxfrom, box) in self.literals[AtomType.BOX_AT]
-            ]
-            for box in boxes:
-                for agtto in agtfrom_neighbours:
-                    action = Pull(agent, agtfrom, agtto, box, boxfrom)
-                    if self.is_applicable(action, self.literals):
-                        possibilities.append(action)
+        for _, pulls in box_actions:
+            for action in pulls:
+                if not occupancy[action.agtto_cell] and (not action.enters_dead or self.has_spare_box(action.box)):
+                    possibilities.append(action)
 
         # Action:
-        possibilities.append(Action(agent))
+        possibilities.append(ActionTable.noops[agent])
 
         return possibilities
 
-    def is_conflicting(self, joint_action: list[Action]) -> tuple[bool, LiteralList]:
-        # This follows the following logic:
-        # For all applicable actions ai and aj where the precondition of one is inconsistent with the
-        # effect of the other, either CellCon ict(ai aj) or BoxCon ict(ai aj) holds.
-        literals = (set(self.literals[0]), set(self.literals[1]))
-
-        for agt, action in enumerate(joint_action):
-            if self.is_applicable(action, literals):
-                literals = action.apply_effects(literals, True)
-            else:
-                return (True, None)
+    def take_tunnels(self, actions: list[Action]) -> list[Action]:
+        """
+        Replace the actions that lead into a tunnel by a macro running through it (see ActionTable.get_tunnel),
+        up to the first cell that is occupied in this state.
+        """
+        occupancy = self.occupancy
+        for i, action in enumerate(actions):
+            if action.enter_cell is None:
+                continue
+            steps = 0
+            for step in ActionTable.get_tunnel(action):
+                if occupancy[step.enter_cell]:
+                    break
+                steps += 1
+            if steps:
+                actions[i] = ActionTable.get_macro(action, steps)
+        return actions
 
-        return (False, literals)
+    def has_spare_box(self, box: Box) -> bool:
+        # A box may only be given up (moved into a dead cell) while its letter still has more boxes than goals
+        return Deadlocks.spare_boxes(box[0], self.box_cells) > 0
 
     def extract_plan(self) -> list[list[Action]]:
         plan = [None] * self.g
         state = self
 
         while state.joint_action is not None:
-            plan[state.g - 1] = state.joint_action
+            steps = Macro.expand(state.joint_action) if State.macro_actions else [state.joint_action]
+            plan[state.g - len(steps):state.g] = steps
             state = state.parent
 
         return plan
 
-    def __hash__(self):
+    @property
+    def zobrist(self) -> int:
+        # 64-bit Zobrist key: XOR of the keys of all atoms, updated incrementally in result()
         if self._hash is None:
-            prime: int = 31
-            _hash: int = 1
-            _hash = _hash * prime + hash(chain(*self.literals))
-            _hash = _hash * prime + hash(tuple(State.agent_colors))
-            _hash = _hash * prime + hash(tuple(State.box_colors))
-            _hash = _hash * prime + hash(chain(*State.goal_literals))
-            self._hash = _hash
+            self._hash = zobrist_hash(self.literals)
         return self._hash
 
+    def materialize(self) -> Self:
+        return self
+
+    def release(self):
+        pass
+
+    def cells(self) -> tuple[CellList, CellList]:
+        return self.agent_cells, self.box_cells
+
+    def __hash__(self):
+        return self.zobrist
+
     def __eq__(self, other):
         if self is other:
             return True
 
-        if isinstance(other, State):
-            return self.literals[0] == other.literals[0] and self.literals[1] == other.literals[1]
+        if type(other) is type(self):
+            return (
+                self.zobrist == other.zobrist
+                and self.agent_cells == other.agent_cells
+                and self.box_cells == other.box_cells
+            )
 
-        return False
+        return NotImplemented
 
     def __repr__(self):
         return f"||{'^'.join(atom_repr(lit) for lit in chain(*self.literals))}||"
+
+
+class Successor:
+    """
+    Handle of a child state that has not been built yet: the parent, the joint action leading to the
+    child, the child's Zobrist key and its cached heuristic value. Handles hash and compare like the
+    State they stand for, materialize() builds that State (cached until release()). Novelty is tested on
+    cells() and the State built for the heuristic is released right away, so queued handles hold no State.
+    """
+    __slots__ = ("parent", "joint_action", "_hash", "h", "_state")
+
+    def __init__(self, parent: State, joint_action: list[Action], zobrist: int):
+        self.parent = parent
+        self.joint_action = joint_action
+        self._hash = zobrist
+        self.h: int | float = None
+        self._state: State = None
+
+    @property
+    def g(self) -> int:
+        if State.macro_actions:
+            return self.parent.g + max(action.length for action in self.joint_action)
+        return self.parent.g + 1
+
+    @property
+    def zobrist(self) -> int:
+        return self._hash
+
+    @property
+    def goals_satisfied(self) -> int:
+        # From the parent's count and the goal delta of the joint action, like State.result()
+        if self._state is not None:
+            return self._state.goals_satisfied
+        agent_goal_cells, box_goal_letters = State.agent_goal_cells, State.box_goal_letters
+        return self.parent.goals_satisfied + sum(
+            action.goal_delta(agent_goal_cells, box_goal_letters) for action in self.joint_action
+        )
+
+    def count_unsatisfied_goals(self) -> int:
+        return State.goal_count - self.goals_satisfied
+
+    def materialize(self) -> State:
+        if self._state is None:
+            self._state = self.parent.result(self.joint_action, skip_check=True)
+            self._state.h = self.h
+        return self._state
+
+    def release(self):
+        self._state = None
+
+    def cells(self) -> tuple[CellList, CellList]:
+        # Agent and box cells of the child without building (or keeping) the State, used for equality and novelty
+        if self._state is not None:
+            return self._state.agent_cells, self._state.box_cells
+        agent_cells = self.parent.agent_cells[:]
+        box_cells = self.parent.box_cells[:]
+        for action in self.joint_action:
+            action.apply_effects(agent_cells, box_cells, skip_check=True)
+        return agent_cells, box_cells
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+
+        if isinstance(other, (State, Successor)):
+            if self._hash != other.zobrist:
+                return False
+            if isinstance(other, Successor):
+                return self.cells() == other.cells()
+            return type(other) is State and self.cells() == (other.agent_cells, other.box_cells)
+
+        return NotImplemented
+
+
+class IntermediateState(State):
+    """
+    Search node of operator decomposition. The agents before next_agent have chosen their action for
+    the current step and are moved accordingly, the remaining agents have not acted yet (their entries
+    in joint_action are NoOps). g and the plan are those of base until the last agent has acted.
+    """
+    __slots__ = ("base", "next_agent")
+
+    def __init__(self, agent_cells: CellList, box_cells: CellList):
+        super().__init__(agent_cells, box_cells)
+        self.base: State = None
+        self.next_agent = 0
+
+    @staticmethod
+    def create(base: State, partial_action: list[Action], parent: State) -> "IntermediateState":
+        joint_action = partial_action + ActionTable.noops[len(partial_action):]
+        state = base.result(joint_action, skip_check=True, state_type=IntermediateState)
+        state.parent = parent
+        state.g = base.g
+        state.base = base
+        state.next_agent = len(partial_action)
+        return state
+
+    def get_successors(self) -> list[State]:
+        return self.expand_agent(self.base, self.joint_action[:self.next_agent])
+
+    def is_goal_state(self) -> bool:
+        return False
+
+    def satisfies_subgoals(self) -> bool:
+        return False
+
+    def extract_plan(self) -> list[list[Action]]:
+        return self.base.extract_plan()
+
+    def __hash__(self):
+        return hash((self.zobrist, self.base.zobrist, self.next_agent))
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+
+        if type(other) is IntermediateState:
+            return (
+                self.next_agent == other.next_agent
+                and self.agent_cells == other.agent_cells
+                and self.box_cells == other.box_cells
+                and self.base == other.base
+            )
+
+        return NotImplemented
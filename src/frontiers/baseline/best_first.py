@@ -1,40 +1,50 @@
-import heapq
-import itertools
-
+from src.frontiers.bucket_queue import BucketQueue
 from src.frontiers.frontier import Frontier
+from src.frontiers.node_table import NodeTable
 from src.heuristics.heuristic import Heuristic
 from src.domain.state import State
 
 
 class FrontierBestFirst(Frontier):
-    def __init__(self, heuristic: "Heuristic"):
+    def __init__(self, heuristic: "Heuristic", deferred: bool = False, lifo: bool = False):
         super().__init__()
         self.heuristic = heuristic
-        self.pqueue = []
-        self.set = set()
-        self.counter = itertools.count()
+        # Deferred evaluation: states are queued with their own g and their parent's h, and only evaluated
+        # themselves once popped (when their own children are queued)
+        self.deferred = deferred
+        self.lifo = lifo
+        self.table = NodeTable()
+        self.init_queue()
+
+    def init_queue(self):
+        # Buckets for integer f values, falls back to a heap for fractional ones
+        self.pqueue = BucketQueue(self.lifo)
 
     def add(self, state: 'State'):
-        priority = self.heuristic.f(state)
-        # state_id is added to solve queue priority conflicts
-        # (if they are the same, it takes the one with smaller id first)
-        state_id = next(self.counter)
-        heapq.heappush(self.pqueue, (priority, state_id, state))
-        self.set.add(state)
+        if state.h is None:
+            state.h = self.table.cached_h(state)
+        if self.deferred and state.h is None and state.parent is not None:
+            priority = self.heuristic.priority(state.g, self.heuristic.evaluate(state.parent))
+        else:
+            priority = self.heuristic.f(state)
+        self.pqueue.push(priority, state)
+        self.table.open(state)
 
     def pop(self) -> 'State':
-        _, _, state = heapq.heappop(self.pqueue)
-        self.set.remove(state)
-        return state
+        # Skip entries superseded by a cheaper path to the same state
+        while True:
+            state = self.pqueue.pop()
+            if self.table.close(state):
+                return state
 
     def is_empty(self) -> 'bool':
-        return len(self.pqueue) == 0
+        return self.table.open_count == 0
 
     def size(self) -> 'int':
-        return len(self.pqueue)
+        return self.table.open_count
 
     def contains(self, state: 'State') -> 'bool':
-        return state in self.set
+        return self.table.is_open(state)
 
     def get_name(self):
         return "Best-first search using {}".format(self.heuristic)
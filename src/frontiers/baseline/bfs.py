@@ -1,6 +1,7 @@
 from collections import deque
 
 from src.frontiers.frontier import Frontier
+from src.frontiers.node_table import NodeTable
 from src.domain.state import State
 
 
@@ -8,25 +9,27 @@ class FrontierBFS(Frontier):
     def __init__(self):
         super().__init__()
         self.queue = deque()
-        self.set = set()
+        self.table = NodeTable()
 
     def add(self, state: 'State'):
         self.queue.append(state)
-        self.set.add(state)
+        self.table.open(state)
 
     def pop(self) -> 'State':
-        state = self.queue.popleft()
-        self.set.remove(state)
-        return state
+        # Skip entries superseded by a cheaper path to the same state
+        while True:
+            state = self.queue.popleft()
+            if self.table.close(state):
+                return state
 
     def is_empty(self) -> 'bool':
-        return len(self.queue) == 0
+        return self.table.open_count == 0
 
     def size(self) -> 'int':
-        return len(self.queue)
+        return self.table.open_count
 
     def contains(self, state: 'State') -> 'bool':
-        return state in self.set
+        return self.table.is_open(state)
 
     def get_name(self):
         return 'Breadth-first search'
@@ -0,0 +1,65 @@
+from src.frontiers.baseline.best_first import FrontierBestFirst
+from src.frontiers.bucket_queue import BucketQueue
+from src.frontiers.novelty import AtomIndex, NoveltyTable
+from src.heuristics.heuristic import Heuristic
+from src.domain.state import State
+
+
+class FrontierBFWS(FrontierBestFirst):
+    """
+    Best-first width search: the novelty of a state is computed only against the states with the same
+    heuristic value (and with goal_count, the same number of unsatisfied goals). It is 1 if the state
+    has an atom new to its partition, 2 if it has a new pair of atoms and width + 1 otherwise.
+    States are not pruned, the queue is ordered by (novelty, h).
+    """
+    def __init__(self, heuristic: "Heuristic", width=2, goal_count=False, deferred: bool = False, lifo: bool = False):
+        self.width = width
+        super().__init__(heuristic, deferred, lifo)
+        self.goal_count = goal_count
+        self.atom_index: AtomIndex = None
+        self.novelty_tables: dict[tuple, list[NoveltyTable]] = {}
+
+    def init_queue(self):
+        # One queue per novelty value (instead of the single queue of best-first search), each ordered by h
+        self.pqueues = [BucketQueue(self.lifo) for _ in range(self.width + 1)]
+
+    def add(self, state: "State"):
+        if state.h is None:
+            state.h = self.table.cached_h(state)
+        if self.deferred and state.h is None and state.parent is not None:
+            h = self.heuristic.evaluate(state.parent)
+        else:
+            h = self.heuristic.evaluate(state)
+        # Novelty is computed from the cells of a handle, without building its State
+        novelty = self.novelty(state, h)
+        self.pqueues[novelty - 1].push(h, state)
+        self.table.open(state)
+
+    def pop(self) -> "State":
+        # Skip entries superseded by a cheaper path to the same state
+        for pqueue in self.pqueues:
+            while len(pqueue):
+                state = pqueue.pop()
+                if self.table.close(state):
+                    return state
+        raise IndexError("pop from an empty frontier")
+
+    def novelty(self, state: "State", h: int | float) -> int:
+        if self.atom_index is None:
+            self.atom_index = AtomIndex(state)
+        key = (h, state.count_unsatisfied_goals()) if self.goal_count else (h,)
+        tables = self.novelty_tables.get(key)
+        if tables is None:
+            num_atoms = self.atom_index.num_atoms
+            tables = self.novelty_tables[key] = [NoveltyTable(num_atoms, width) for width in range(1, self.width + 1)]
+
+        # Every table marks the state's atoms, the novelty is the smallest width with something new
+        atoms = self.atom_index.atoms(state)
+        novelty = self.width + 1
+        for width, table in enumerate(tables, 1):
+            if table.is_novel(atoms) and novelty > width:
+                novelty = width
+        return novelty
+
+    def get_name(self):
+        return "Best-first width search using {}".format(self.heuristic)
@@ -0,0 +1,77 @@
+from collections import deque
+import heapq
+import itertools
+
+# Buckets are only allocated up to BUCKET_RANGE, or BUCKET_FACTOR times the smallest queued priority if that is
+# larger. A priority beyond that (like a sentinel for unreachable goals) would leave the buckets sparse, the
+# queue falls back to the heap instead
+BUCKET_RANGE = 1024
+BUCKET_FACTOR = 4
+
+
+class BucketQueue:
+    """
+    Priority queue for small non-negative integer priorities: one deque per priority value, so push and
+    pop-min are O(1) (pop amortized over the scan for the next non-empty bucket). Equal priorities are
+    popped FIFO, or LIFO with lifo=True. The first fractional, negative or very large priority converts
+    the queue into a binary heap of (priority, counter, item), keeping the order of equal priorities.
+    Priorities are very large if they exceed both BUCKET_RANGE and BUCKET_FACTOR * the smallest queued one.
+    """
+    def __init__(self, lifo: bool = False):
+        self.lifo = lifo
+        self.buckets: list[deque] = []
+        self.min_priority = 0
+        self.length = 0
+        self.heap: list = None
+        self.counter = itertools.count()
+
+    def push(self, priority: int | float, item):
+        if self.heap is None:
+            if isinstance(priority, float) and priority.is_integer():
+                priority = int(priority)
+            if isinstance(priority, int) and priority >= 0:
+                # An empty queue takes its range from the first priority pushed
+                min_priority = priority if self.length == 0 else min(priority, self.min_priority)
+                buckets = self.buckets
+                if priority < len(buckets) or priority < max(BUCKET_RANGE, BUCKET_FACTOR * min_priority):
+                    while len(buckets) <= priority:
+                        buckets.append(deque())
+                    buckets[priority].append(item)
+                    self.min_priority = min_priority
+                    self.length += 1
+                    return
+            self.to_heap()
+
+        # counter is added to solve queue priority conflicts (FIFO or LIFO among equal priorities)
+        count = next(self.counter)
+        heapq.heappush(self.heap, (priority, -count if self.lifo else count, item))
+        self.length += 1
+
+    def pop(self):
+        if self.heap is not None:
+            _, _, item = heapq.heappop(self.heap)
+            self.length -= 1
+            return item
+
+        if self.length == 0:
+            raise IndexError("pop from an empty BucketQueue")
+        buckets = self.buckets
+        priority = self.min_priority
+        while not buckets[priority]:
+            priority += 1
+        self.min_priority = priority
+        self.length -= 1
+        return buckets[priority].pop() if self.lifo else buckets[priority].popleft()
+
+    def to_heap(self):
+        heap = []
+        for priority, bucket in enumerate(self.buckets):
+            for item in bucket:
+                count = next(self.counter)
+                heap.append((priority, -count if self.lifo else count, item))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.buckets = []
+
+    def __len__(self):
+        return self.length
@@ -1,11 +1,13 @@
 from abc import ABCMeta, abstractmethod
 
 from src.domain.state import State
+from src.frontiers.node_table import NodeTable
 from src.heuristics.heuristic import Heuristic
 
 
 class Frontier(metaclass=ABCMeta):
     heuristic: Heuristic = None
+    table: NodeTable = None
     @abstractmethod
     def add(self, state: 'State'): raise NotImplementedError
 
@@ -1,21 +1,48 @@
+from array import array
 from itertools import chain, combinations
 
 from src.frontiers.baseline.best_first import FrontierBestFirst
+from src.frontiers.novelty import AtomIndex, NoveltyTable
 from src.heuristics.heuristic import Heuristic
-from src.domain.state import State
+from src.domain.state import IntermediateState, State
 
 
 class FrontierIW(FrontierBestFirst):
-    def __init__(self, heuristic: "Heuristic", width=1):
-        super().__init__(heuristic)
+    def __init__(self, heuristic: "Heuristic", width=1, deferred: bool = False, lifo: bool = False):
+        super().__init__(heuristic, deferred, lifo)
         self.width = width
         self.known_combinations = set()
+        # Bitset novelty for width 1 and 2, created with the first state
+        self.atom_index: AtomIndex = None
+        self.novelty: NoveltyTable = None
+        # Indices (into State.get_successors, which is deterministic) and h of the new successors of every
+        # expanded state that passed the cutoff, kept across width escalation. Only these numbers are kept, the handles
+        # are generated again when a state is expanded at a higher width
+        self.expanded: dict[State, tuple[array, array]] = {}
         print(f"#Initialized frontier with width {self.width}")
 
     def add(self, state: "State"):
-        if self.is_novel_combination(state.literals):
+        # Operator decomposition: an intermediate node where an agent was assigned NoOp has the atoms of its
+        # parent, so only the full states at the end of a step are tested for novelty
+        if isinstance(state, IntermediateState) or self.is_novel(state):
             super().add(state)
 
+    def escalate(self) -> "FrontierIW":
+        """
+        Frontier for width + 1 that builds on this search: states expanded at a lower width keep the
+        successors that passed the cutoff and their h. The search restarts from the initial state so
+        novelty is tested in the order of a fresh run, but no state is evaluated twice.
+        """
+        return self.restart(self.width + 1)
+
+    def restart(self, width: int) -> "FrontierIW":
+        """
+        Empty frontier of the given width sharing the successor lists of this one (see escalate()).
+        """
+        frontier = FrontierIW(self.heuristic, width, self.deferred, self.lifo)
+        frontier.expanded = self.expanded
+        return frontier
+
     def pop(self) -> "State":
         return super().pop()
 
@@ -31,6 +58,16 @@ class FrontierIW(FrontierBestFirst):
     def get_name(self):
         return "Iterated-width search"
 
+    def is_novel(self, state: "State") -> bool:
+        # Tested on the cells of states and successor handles alike, handles are not built for it
+        if self.atom_index is None:
+            self.atom_index = AtomIndex(state)
+        if self.width > 2:
+            return self.is_novel_combination([self.atom_index.atoms(state)])
+        if self.novelty is None:
+            self.novelty = NoveltyTable(self.atom_index.num_atoms, self.width)
+        return self.novelty.is_novel(self.atom_index.atoms(state))
+
     def is_novel_combination(self, elements):
         """
         Check if there's a new combination of elements of size self.width.
@@ -0,0 +1,75 @@
+from array import array
+
+from src.domain.state import State
+
+OPEN = 0
+CLOSED = 1
+
+
+class NodeTable:
+    """
+    Open/closed list shared by graph_search and the frontiers. Nodes (states or successor handles) are
+    keyed by their Zobrist hash and map to an index into parallel arrays of g, h and status.
+    A node is (re)opened when it is new or reached with a lower g than before. Queue entries superseded
+    this way are stale: close() rejects them and the frontiers skip them when popping. The h of a node is
+    kept when it is reopened, so a state reached again is not evaluated again (see cached_h).
+    """
+    def __init__(self):
+        self.index: dict[State, int] = {}
+        self.g = array("l")
+        self.h: list[int | float | None] = []
+        self.status = bytearray()
+        self.open_count = 0
+        self.closed_count = 0
+
+    def improves(self, state: State) -> bool:
+        i = self.index.get(state)
+        return i is None or state.g < self.g[i]
+
+    def open(self, state: State):
+        i = self.index.get(state)
+        if i is None:
+            self.index[state] = len(self.g)
+            self.g.append(state.g)
+            self.h.append(state.h)
+            self.status.append(OPEN)
+            self.open_count += 1
+            return
+
+        if self.status[i] == CLOSED:
+            self.closed_count -= 1
+            self.open_count += 1
+        self.g[i] = state.g
+        if state.h is not None:
+            self.h[i] = state.h
+        self.status[i] = OPEN
+
+    def close(self, state: State) -> bool:
+        """
+        Close a node popped from a queue, returns False if the queue entry is stale.
+        """
+        i = self.index.get(state)
+        if i is None or self.status[i] == CLOSED or state.g != self.g[i]:
+            return False
+        self.status[i] = CLOSED
+        self.open_count -= 1
+        self.closed_count += 1
+        return True
+
+    def cached_h(self, state: State) -> int | float | None:
+        """
+        h of a node opened before, None for new nodes and nodes opened without h (deferred evaluation).
+        """
+        i = self.index.get(state)
+        return None if i is None else self.h[i]
+
+    def is_open(self, state: State) -> bool:
+        i = self.index.get(state)
+        return i is not None and self.status[i] == OPEN
+
+    def is_closed(self, state: State) -> bool:
+        i = self.index.get(state)
+        return i is not None and self.status[i] == CLOSED
+
+    def __len__(self):
+        return len(self.g)
@@ -0,0 +1,75 @@
+from array import array
+from itertools import chain
+
+from src.domain.location import Location
+from src.domain.state import State
+
+
+class AtomIndex:
+    """
+    Dense atom indices: slot * num_cells + free cell index, where slot is the agent number or
+    num_agents + box index (see State.box_order). A state's atoms are read directly from its cell
+    arrays (see State.cells and Successor.cells) and come out in ascending order.
+    """
+    def __init__(self, state: State):
+        self.cell_index = array("l", [-1]) * len(Location.wall_cells)
+        num_cells = 0
+        for cell, is_wall in enumerate(Location.wall_cells):
+            if not is_wall:
+                self.cell_index[cell] = num_cells
+                num_cells += 1
+        self.num_cells = num_cells
+        agent_cells, box_cells = state.cells()
+        self.num_atoms = (len(agent_cells) + len(box_cells)) * num_cells
+
+    def atoms(self, state: State) -> list[int]:
+        cell_index = self.cell_index
+        num_cells = self.num_cells
+        return [
+            slot * num_cells + cell_index[cell]
+            for slot, cell in enumerate(chain(*state.cells()))
+        ]
+
+
+class NoveltyTable:
+    """
+    Novelty check of width 1 or 2 over dense atom indices (see AtomIndex), without allocations per state.
+    Width 1 keeps one byte per atom, width 2 a triangular bit matrix whose rows are allocated on first use.
+    """
+    def __init__(self, num_atoms: int, width: int):
+        if width not in (1, 2):
+            raise ValueError(f"NoveltyTable supports width 1 and 2, not {width}")
+        self.width = width
+        self.num_atoms = num_atoms
+        self.seen = bytearray(num_atoms) if width == 1 else None
+        # rows[i] has one bit per atom j > i, bit j - i - 1
+        self.rows: list[bytearray] = [None] * num_atoms if width == 2 else None
+
+    def is_novel(self, atoms: list[int]) -> bool:
+        """
+        Check if there is an atom (width 1) or pair of atoms (width 2) not seen before, and mark them as seen.
+        The atoms must be sorted ascending.
+        """
+        novel = False
+
+        if self.width == 1:
+            seen = self.seen
+            for i in atoms:
+                if not seen[i]:
+                    seen[i] = 1
+                    novel = True
+            return novel
+
+        rows = self.rows
+        num_atoms = self.num_atoms
+        for a, i in enumerate(atoms):
+            row = rows[i]
+            if row is None:
+                row = rows[i] = bytearray((num_atoms - i + 6) >> 3)
+            for j in atoms[a + 1:]:
+                k = j - i - 1
+                bit = 1 << (k & 7)
+                if not row[k >> 3] & bit:
+                    row[k >> 3] |= bit
+                    novel = True
+        return novel
@@ -0,0 +1,96 @@
+import numpy as np
+
+INFINITE_COST = np.iinfo(np.int64).max // 4
+
+
+class Matching:
+    """
+    Minimum-cost perfect matching of rows to columns (Hungarian algorithm with row and column potentials).
+    Rectangular cost matrices are padded to a square with zero-cost dummy rows or columns, the matches
+    of dummies are reported as -1. After the costs of one column change, update_column() repairs the
+    matching with a single augmenting path instead of solving again.
+    """
+    def __init__(self, costs: np.ndarray):
+        num_rows, num_cols = costs.shape
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        n = max(num_rows, num_cols)
+        self.costs = np.zeros((n, n), dtype=np.int64)
+        self.costs[:num_rows, :num_cols] = costs
+        self.u = np.zeros(n, dtype=np.int64)
+        self.v = np.zeros(n, dtype=np.int64)
+        self.col_row = np.full(n, -1, dtype=np.int64)
+        for row in range(n):
+            self.augment(row)
+
+    def augment(self, root: int) -> list[int]:
+        """
+        Match the free row root by a shortest augmenting path in the reduced costs, keeping the potentials
+        feasible. Returns the columns whose row changed.
+        """
+        n = len(self.u)
+        costs, u, v, col_row = self.costs, self.u, self.v, self.col_row
+        min_reduced = np.full(n, INFINITE_COST, dtype=np.int64)
+        previous_col = np.full(n, -1, dtype=np.int64)
+        used = np.zeros(n, dtype=bool)
+
+        row, col = root, -1
+        while True:
+            if col >= 0:
+                used[col] = True
+            reduced = costs[row] - u[row] - v
+            better = ~used & (reduced < min_reduced)
+            min_reduced[better] = reduced[better]
+            previous_col[better] = col
+
+            candidates = np.where(used, INFINITE_COST, min_reduced)
+            next_col = int(np.argmin(candidates))
+            delta = candidates[next_col]
+            u[root] += delta
+            used_cols = np.flatnonzero(used)
+            u[col_row[used_cols]] += delta
+            v[used_cols] -= delta
+            min_reduced[~used] -= delta
+
+            col = next_col
+            if col_row[col] < 0:
+                break
+            row = col_row[col]
+
+        changed = []
+        while col >= 0:
+            prev = previous_col[col]
+            col_row[col] = col_row[prev] if prev >= 0 else root
+            changed.append(col)
+            col = prev
+        return changed
+
+    def update_column(self, col: int, costs: np.ndarray) -> list[int]:
+        """
+        Replace the costs of a column and restore an optimal matching. Returns the (real) columns whose row
+        changed, including col itself.
+        """
+        self.costs[:self.num_rows, col] = costs
+        row = self.col_row[col]
+        self.col_row[col] = -1
+        self.v[col] = np.min(self.costs[:, col] - self.u)
+        changed = self.augment(row)
+        return [changed_col for changed_col in changed if changed_col < self.num_cols]
+
+    def row_of(self, col: int) -> int:
+        row = self.col_row[col]
+        return int(row) if row < self.num_rows else -1
+
+    def cols(self) -> list[int]:
+        """
+        Column matched to every (real) row, -1 for rows matched to a dummy column.
+        """
+        row_col = [-1] * self.num_rows
+        for col in range(self.num_cols):
+            row = self.col_row[col]
+            if row < self.num_rows:
+                row_col[row] = col
+        return row_col
+
+    def cost(self) -> int:
+        return int(sum(self.costs[self.col_row[col], col] for col in range(len(self.col_row))))
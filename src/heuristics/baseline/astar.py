@@ -7,7 +7,10 @@ class HeuristicAStar(Heuristic):
         super().__init__(initial_state)
 
     def f(self, state: 'State') -> 'int':
-        return state.g + self.h(state)
+        return state.g + self.evaluate(state)
+
+    def priority(self, g: int, h: 'int') -> 'int':
+        return g + h
 
     def __repr__(self):
         return 'A* evaluation'
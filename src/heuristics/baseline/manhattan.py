@@ -29,7 +29,7 @@ class HeuristicManhattan(Heuristic):
         return total_distance
 
     def f(self, state: 'State') -> 'int':
-        return self.h(state)
+        return self.evaluate(state)
 
     def __repr__(self):
         return "Manhattan distance heuristic"
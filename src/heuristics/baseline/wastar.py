@@ -8,7 +8,10 @@ class HeuristicWeightedAStar(Heuristic):
         self.w = w
 
     def f(self, state: 'State') -> 'int':
-        return state.g + self.w * self.h(state)
+        return state.g + self.w * self.evaluate(state)
+
+    def priority(self, g: int, h: 'int') -> 'int':
+        return g + self.w * h
 
     def __repr__(self):
         return 'WA*({}) evaluation'.format(self.w)
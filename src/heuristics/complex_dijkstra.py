@@ -1,61 +1,144 @@
+from array import array
 import heapq
 import math
-import sys
 from typing import Tuple
 
+import numpy as np
+
 from src.domain.location import Location
+from src.domain.map_analysis import NO_CHOKE_POINT, MapAnalysis
 from src.domain.atom import Box, Pos, eval_free
-from src.domain.state import State
+from src.domain.state import IntermediateState, State
+from src.heuristics.assignment import Matching
+from src.heuristics.distance_table import DistanceTable
 from src.heuristics.heuristic import Heuristic
 from src.utils.helpers import find_key_by_value
-sys.setrecursionlimit(100_000) # HACK: Upped limit to not die on WallE.lvl and YummAI.lvl during name_choke_points()
-
-NO_CHOKE_POINT = -1
-
 
 class HeuristicComplexDijkstra(Heuristic):
     def __init__(self, initial_state: State):
         super().__init__(initial_state)
-        self.distances = None
+        self.distances: DistanceTable = None
         self.box_order = {}
         self.create_all_dijkstra_mappings(initial_state)
-        self.choke_point_detection = [
-            [None] * self.num_cols for _ in range(self.num_rows)
-        ]
-        self.choke_point_count = {}
+        self.choke_point_detection: np.ndarray = None
+        self.choke_point_count: dict[int, int] = {}
         self.setup_choke_points()
         self.agent_assigned_to_box = self.assign_boxes_to_agents(initial_state)
         self.box_goal_assigned_to_box = self.assign_boxes_to_goals(initial_state)
         self.box_priority = self.calculate_box_priority(initial_state)
+        # The boxes change goals during search (see sync_assignment), their weight stays with the goal
+        self.goal_priority = {
+            box_goal: self.box_priority[box]
+            for box, box_goal in self.box_goal_assigned_to_box.items()
+            if box in self.box_priority
+        }
+        # Box indices (see State.box_index) assigned to every agent, and the agent every box is assigned to
+        self.agent_box_indices = [
+            [State.box_index[box] for box in self.agent_assigned_to_box.get(agent, ())]
+            for agent in range(len(initial_state.agent_cells))
+        ]
+        self.box_agent = [None] * len(State.box_order)
+        for agent, box_indices in enumerate(self.agent_box_indices):
+            for i in box_indices:
+                self.box_agent[i] = agent
 
     def h(self, state: State) -> float | int:
+        agent_totals, _, _ = self.get_terms(state)
+        joint_action = state.lastActions
         total_distance = 0
-
-        for agent, box in enumerate(state.recalculateDistanceOfBox):
-            if box is not None:
-                self.get_distances(state, state.box_locations[box])
-                state.recalculateDistanceOfBox[agent] = None
-
-        for agent, agent_loc in state.agent_locations.items():
-            boxes_not_in_goal = self.get_boxes_not_in_goal(agent, state)
-            total_distance += self.calculate_total_distance(
-                agent, agent_loc, boxes_not_in_goal, state
-            )
+        for agent, agent_total in enumerate(agent_totals):
+            if agent_total != 0 and joint_action and joint_action[agent].name == "NoOp":
+                agent_total += self.get_waiting_penalty(agent, state)
+            total_distance += agent_total
 
         return total_distance
 
+    def evaluate_successors(self, state: State, successors: list[State]) -> list[float | int]:
+        """
+        The terms of the state the successors start from are kept on it (as h_terms) only while they are evaluated.
+        """
+        origin = state.base if isinstance(state, IntermediateState) else state
+        origin.h_terms = self.get_terms(origin)
+        try:
+            return super().evaluate_successors(state, successors)
+        finally:
+            origin.h_terms = None
+
+    def get_terms(self, state: State) -> tuple[array, array, list[Box]]:
+        """
+        Per-agent totals (weighted box distances plus the distance to the agent's goal), per-box weighted
+        distances and the goal of every box in a state. A child starts from the terms of the state its joint
+        action was applied to if they are set (see evaluate_successors), and only the agents that moved, the
+        boxes that were moved or changed goals (with the other boxes of their agents) are evaluated again.
+        """
+        if state.h_terms is not None:
+            return state.h_terms
+
+        origin = state.base if isinstance(state, IntermediateState) else state.parent
+        if origin is None or origin.h_terms is None:
+            return self.calculate_terms(state)
+
+        self.sync_assignment(state)
+        box_goals = self.box_goal[:]
+        origin_totals, origin_box_terms, origin_box_goals = origin.h_terms
+        agent_totals = origin_totals[:]
+        box_terms = origin_box_terms[:]
+        changed_agents = set()
+        changed_boxes = [State.box_index[action.box] for action in state.joint_action if action.box is not None]
+        if box_goals != origin_box_goals:
+            changed_boxes += [i for i, box_goal in enumerate(box_goals) if box_goal != origin_box_goals[i]]
+
+        for agent in range(len(state.agent_cells)):
+            if state.agent_cells[agent] != origin.agent_cells[agent]:
+                changed_agents.add(agent)
+                for i in self.agent_box_indices[agent]:
+                    box_terms[i] = self.calculate_box_term(agent, i, state, box_goals)
+        for i in changed_boxes:
+            owner = self.box_agent[i]
+            # The terms of all boxes of an agent that moved are evaluated with the agent
+            if owner is not None and state.agent_cells[owner] == origin.agent_cells[owner]:
+                changed_agents.add(owner)
+                box_terms[i] = self.calculate_box_term(owner, i, state, box_goals)
+
+        for agent in changed_agents:
+            agent_totals[agent] = self.calculate_agent_total(agent, state, box_terms)
+        return agent_totals, box_terms, box_goals
+
+    def sync_assignment(self, state: State):
+        """
+        Bring the box-to-goal matchings to the box cells of state: every box whose cell differs from the last
+        synced state gets new costs, and its matching is repaired (see Matching.update_column).
+        """
+        matched_cells = self.matched_cells
+        if state.box_cells == matched_cells:
+            return
+        for i, cell in enumerate(state.box_cells):
+            if cell == matched_cells[i]:
+                continue
+            matched_cells[i] = cell
+            if self.box_column[i] is None:
+                continue
+            letter, col = self.box_column[i]
+            matching = self.goal_matchings[letter]
+            costs = self.distances.distances_to(self.letter_goal_cells[letter], cell)
+            for changed_col in matching.update_column(col, costs):
+                row = matching.row_of(changed_col)
+                box_goal = self.letter_goals[letter][row] if row >= 0 else None
+                self.box_goal[self.letter_boxes[letter][changed_col]] = box_goal
+
     def f(self, state: State) -> float | int:
-        return self.h(state)
+        return self.evaluate(state)
 
     def __repr__(self):
         return "Custom Uniform-Cost Search Heuristic"
 
     def setup_choke_points(self):
-        for row, row_walls in enumerate(Location.walls):
-            for col, is_wall in enumerate(row_walls):
-                if not is_wall:
-                    self.name_choke_points(row, col, 0)
-                    return
+        """
+        Corridor id of every cell (NO_CHOKE_POINT for walls and cells with more than two free neighbours)
+        and the length of every corridor, see MapAnalysis.
+        """
+        self.choke_point_detection = MapAnalysis.grid(MapAnalysis.corridor)
+        self.choke_point_count = dict(enumerate(MapAnalysis.corridor_length.tolist()))
 
     def calculate_box_priority(self, initial_state: State) -> dict[Box, float]:
         self.box_order = self.order_boxes(initial_state)
@@ -68,7 +151,7 @@ class HeuristicComplexDijkstra(Heuristic):
             box_goal = self.box_goal_assigned_to_box[t[0]]
             return (
                 -self.box_order[box_goal],
-                self.get_distances(initial_state, initial_state.box_locations[t[0]])[t[1].row][t[1].col],
+                self.get_distance(initial_state.box_locations[t[0]], t[1]),
             )
 
         sorted_boxes = sorted(
@@ -82,93 +165,68 @@ class HeuristicComplexDijkstra(Heuristic):
 
         return box_priority
 
-    def get_boxes_not_in_goal(self, agent, state):
-        return [
-            b
-            for b_name in State.agent_box_dict[agent]
-            for b in State.boxes[b_name]
-            if b in self.box_goal_assigned_to_box
-               and self.box_goal_assigned_to_box[b] in self.box_goal_positions
-               and self.box_goal_positions[self.box_goal_assigned_to_box[b]]
-               != state.box_locations[b]
-        ]
-
-    def calculate_total_distance(self, agent:int, agent_loc: Pos, boxes_not_in_goal, state: State):
-        total_distance = 0
-        for box in self.agent_assigned_to_box[agent]:
-            if box in self.box_goal_assigned_to_box and box in boxes_not_in_goal:
-                box_loc = state.box_locations[box]
-                box_distance = self.calculate_box_distance(
-                    agent_loc, box_loc, state, box
-                )
-                total_distance += box_distance * self.box_priority[box]
+    def calculate_terms(self, state: State) -> tuple[array, array, list[Box]]:
+        self.sync_assignment(state)
+        box_goals = self.box_goal[:]
+        box_terms = array("d", bytes(8 * len(state.box_cells)))
+        for agent, box_indices in enumerate(self.agent_box_indices):
+            for i in box_indices:
+                box_terms[i] = self.calculate_box_term(agent, i, state, box_goals)
+        agent_totals = array("d", (
+            self.calculate_agent_total(agent, state, box_terms) for agent in range(len(state.agent_cells))
+        ))
+        return agent_totals, box_terms, box_goals
+
+    def calculate_box_term(self, agent: int, box_index: int, state: State, box_goals: list[Box]) -> float:
+        """
+        Weighted distance of a box assigned to agent, 0 if the box has no goal or is on its goal.
+        """
+        box_goal = box_goals[box_index]
+        if box_goal is None or box_goal not in self.goal_priority:
+            return 0.0
+        box_loc = state.box_locations[State.box_order[box_index]]
+        if self.box_goal_positions[box_goal] == box_loc:
+            return 0.0
+        agent_loc = state.agent_locations[agent]
+        return self.calculate_box_distance(agent_loc, box_loc, box_goal) * self.goal_priority[box_goal]
+
+    def calculate_agent_total(self, agent: int, state: State, box_terms: array) -> float:
+        # Summed in the order of the assigned boxes, so the total does not depend on how it was reached
+        total_distance = 0.0
+        for i in self.agent_box_indices[agent]:
+            total_distance += box_terms[i]
 
         if agent in self.agent_goal_positions:
-            total_distance += self.get_distances(
-                state, self.agent_goal_positions[agent]
-            )[agent_loc.row][agent_loc.col] * self.get_priority(len(self.box_priority))
-        if total_distance != 0 and state.lastActions:
-            close_agents = HeuristicComplexDijkstra.get_close_agents(agent_loc, state.agent_locations)
-            # close_boxes = HeuristicComplexDijkstra.get_close_boxes(agent_loc, state.box_locations)
-            if len(close_agents) > 0:
-                min_agent = min(close_agents, key=close_agents.get)
-                if agent < min_agent and state.lastActions[agent].get_name() == "NoOp":
-                    total_distance += 1
+            total_distance += self.get_distance(
+                self.agent_goal_positions[agent], state.agent_locations[agent]
+            ) * self.get_priority(len(self.box_priority))
         return total_distance
 
-    def calculate_box_distance(self, agent_loc, box_loc, state, box):
+    def get_waiting_penalty(self, agent: int, state: State) -> int:
+        # 1 if the agent waits next to agents and has a lower number than the one at the smallest position
+        close_agents = HeuristicComplexDijkstra.get_close_agents(state.agent_locations[agent], state.agent_locations)
+        # close_boxes = HeuristicComplexDijkstra.get_close_boxes(agent_loc, state.box_locations)
+        if len(close_agents) > 0:
+            min_agent = min(close_agents, key=close_agents.get)
+            if agent < min_agent:
+                return 1
+        return 0
+
+    def calculate_box_distance(self, agent_loc: Pos, box_loc: Pos, box_goal: Box) -> int:
         box_distance = 0
         if not self.is_close(agent_loc, box_loc):
-            box_distance += (
-                    self.get_distances(state, box_loc)[agent_loc.row][agent_loc.col] - 1
-            )
-        box_distance += self.get_distances(
-            state, self.box_goal_positions[self.box_goal_assigned_to_box[box]]
-        )[box_loc.row][box_loc.col]
+            box_distance += self.get_distance(box_loc, agent_loc) - 1
+        box_distance += self.get_distance(self.box_goal_positions[box_goal], box_loc)
         return box_distance
 
-    def name_choke_points(self, row, col, id):
-        if Location.walls[row][col]:
-            print("ERROR: Started name_choke_points in a wall.")
-            return
-
-        possible_moves = []
-        if len(Location.walls) > row + 1 and not Location.walls[row + 1][col]:
-            possible_moves += [(row + 1, col)]
-
-        if 0 <= row - 1 and not Location.walls[row - 1][col]:
-            possible_moves += [(row - 1, col)]
-
-        if len(Location.walls[row]) > col + 1 and not Location.walls[row][col + 1]:
-            possible_moves += [(row, col + 1)]
-
-        if 0 <= col - 1 and not Location.walls[row][col - 1]:
-            possible_moves += [(row, col - 1)]
-
-        if len(possible_moves) > 2:
-            self.choke_point_detection[row][col] = NO_CHOKE_POINT
-        else:
-            self.choke_point_detection[row][col] = id
-            if id not in self.choke_point_count:
-                self.choke_point_count[id] = 0
-            self.choke_point_count[id] += 1
-
-        for move in possible_moves:
-            if self.choke_point_detection[move[0]][move[1]] is None:
-                if self.choke_point_detection[row][col] == NO_CHOKE_POINT:
-                    id += 1
-                self.name_choke_points(move[0], move[1], id)
-
     def create_all_dijkstra_mappings(self, state: State):
-        self.distances: dict[Pos, list[list[int | float]]] = {}
-        for _, loc in self.agent_goal_positions.items():
-            self.get_distances(state=state, position=loc)
-
-        for _, loc in self.box_goal_positions.items():
-            self.get_distances(state=state, position=loc)
-
-        for _, (_, loc) in enumerate(state.box_locations.items()):
-            self.get_distances(state=state, position=loc)
+        sources = [
+            *self.agent_goal_positions.values(),
+            *self.box_goal_positions.values(),
+            *state.box_locations.values(),
+            *state.agent_locations.values(),
+        ]
+        self.distances = DistanceTable(Location.cell(loc) for loc in sources)
 
     def order_boxes(self, state: State) -> dict[Box, int]:
         '''        
@@ -201,59 +259,35 @@ class HeuristicComplexDijkstra(Heuristic):
         return box_order
 
     def assign_boxes_to_agents(self, state: State) -> dict[int, list[Box]]:
-        agent_assigned_to_box = self.initialize_agent_box_dict()
-        for color in set(State.agent_colors):
-            agent_boxes = self.create_agent_boxes(state, color)
-            while not self.all_boxes_assigned(agent_boxes):
-                best_agent = self.find_best_agent(agent_boxes)
-                if best_agent is not None:
-                    self.assign_box_to_agent(
-                        best_agent, agent_boxes, agent_assigned_to_box
-                    )
-        return agent_assigned_to_box
+        '''
+        returns Dictionary agent:key -> boxes:value
 
-    @staticmethod
-    def initialize_agent_box_dict():
-        return {agent: [] for agent in State.agent_box_dict}
-
-    def create_agent_boxes(self, state: State, color: str):
-        agent_boxes = {
-            agent: []
-            for agent in State.agent_box_dict
-            if State.agent_colors[agent] == color
-        }
-        for agent in agent_boxes:
-            agent_loc = state.agent_locations[agent]
-            agent_boxes[agent] = [
-                (
-                    box,
-                    self.get_distances(state, agent_loc)[state.box_locations[box].row][
-                        state.box_locations[box].col
-                    ],
+        Per color the boxes are matched to the agents at minimum total agent-to-box distance, every agent
+        taking at most its share (rounded up) of the boxes. An agent's boxes are ordered by distance.
+        '''
+        agent_assigned_to_box = {agent: [] for agent in State.agent_box_dict}
+        for color in set(State.agent_colors):
+            agents = [agent for agent in State.agent_box_dict if State.agent_colors[agent] == color]
+            if not agents:
+                continue
+            boxes = self.get_agent_boxes(agents[0])
+            if not boxes:
+                continue
+            slots = -(-len(boxes) // len(agents))
+            costs = np.array([
+                [self.get_distance(state.agent_locations[agent], state.box_locations[box]) for box in boxes]
+                for agent in agents
+                for _ in range(slots)
+            ], dtype=np.int64)
+            matching = Matching(costs)
+            for col, box in enumerate(boxes):
+                agent_assigned_to_box[agents[matching.row_of(col) // slots]].append(box)
+            for agent in agents:
+                agent_loc = state.agent_locations[agent]
+                agent_assigned_to_box[agent].sort(
+                    key=lambda box: (self.get_distance(agent_loc, state.box_locations[box]), box)
                 )
-                for box in self.get_agent_boxes(agent)
-            ]
-            agent_boxes[agent].sort(key=lambda x: x[1])
-        return agent_boxes
-
-    @staticmethod
-    def all_boxes_assigned(agent_boxes):
-        return all(not boxes for boxes in agent_boxes.values())
-
-    def find_best_agent(self, agent_boxes):
-        eligible_agents = self.get_eligible_agents(agent_boxes)
-        return min(
-            eligible_agents,
-            key=lambda agent: (
-                agent_boxes[agent][0][1] if agent_boxes[agent] else float("inf")
-            ),
-            default=None,
-        )
-
-    def assign_box_to_agent(self, best_agent, agent_boxes, agent_assigned_to_box):
-        box_to_add = agent_boxes[best_agent].pop(0)[0]
-        self.remove_box_from_other_agents(agent_boxes, box_to_add)
-        agent_assigned_to_box[best_agent].append(box_to_add)
+        return agent_assigned_to_box
 
     @staticmethod
     def get_agent_boxes(agent):
@@ -263,63 +297,46 @@ class HeuristicComplexDijkstra(Heuristic):
             for box in State.boxes[box_name]
         ]
 
-    @staticmethod
-    def get_eligible_agents(agent_boxes):
-        min_boxes = min(len(boxes) for boxes in agent_boxes.values())
-        return [
-            agent for agent, boxes in agent_boxes.items() if len(boxes) == min_boxes
-        ]
-
-    @staticmethod
-    def remove_box_from_other_agents(agent_boxes, box_to_add):
-        for boxes in agent_boxes.values():
-            boxes[:] = [(b, t) for (b, t) in boxes if b != box_to_add]
-
     def assign_boxes_to_goals(self, state: State) -> dict[Box, Box]:
         '''
         returns Dictionary box:key -> box_goal:value
+
+        Per letter the goals are matched to the boxes at minimum total goal-to-box distance. The matchings
+        are kept (self.goal_matchings) and repaired while boxes move, see sync_assignment.
         '''
-        box_goal_assigned_to_box = {}
-        goal_boxes = self.create_goal_boxes(state)
-
-        for box_goal in goal_boxes:
-            if goal_boxes[box_goal]:
-                new_box = goal_boxes[box_goal].pop(0)[0]
-                box_goal_assigned_to_box[new_box] = box_goal
-                self.remove_box_from_other_goals(goal_boxes, new_box)
-
-        return box_goal_assigned_to_box
-
-    def create_goal_boxes(self, state: State):
-        goal_boxes = {
-            box_goal: []
-            for box_name in State.boxgoals
-            for box_goal in State.boxgoals[box_name]
+        self.goal_matchings: dict[int, Matching] = {}
+        self.letter_goals: dict[int, list[Box]] = {}  # Goal of every row
+        self.letter_goal_cells: dict[int, np.ndarray] = {}
+        self.letter_boxes: dict[int, list[int]] = {}  # Box index of every column
+        self.box_column: list[tuple[int, int] | None] = [None] * len(State.box_order)
+        self.box_goal: list[Box | None] = [None] * len(State.box_order)
+        self.matched_cells = state.box_cells[:]
+
+        for letter, box_goals in State.boxgoals.items():
+            box_goals = [box_goal for box_goal in box_goals if box_goal in self.box_goal_positions]
+            boxes = State.boxes.get(letter, [])
+            if not box_goals or not boxes:
+                continue
+            goal_cells = np.array([Location.cell(self.box_goal_positions[box_goal]) for box_goal in box_goals])
+            costs = np.stack([
+                self.distances.distances_to(goal_cells, state.box_cells[State.box_index[box]]) for box in boxes
+            ], axis=1)
+            matching = Matching(costs)
+            self.goal_matchings[letter] = matching
+            self.letter_goals[letter] = box_goals
+            self.letter_goal_cells[letter] = goal_cells
+            self.letter_boxes[letter] = [State.box_index[box] for box in boxes]
+            for col, box in enumerate(boxes):
+                i = State.box_index[box]
+                # A single box with a single goal never changes it, the box needs no repairs
+                if len(boxes) > 1 or len(box_goals) > 1:
+                    self.box_column[i] = (letter, col)
+                row = matching.row_of(col)
+                self.box_goal[i] = box_goals[row] if row >= 0 else None
+
+        return {
+            State.box_order[i]: box_goal for i, box_goal in enumerate(self.box_goal) if box_goal is not None
         }
-        for box_goal in goal_boxes:
-            goal_boxes[box_goal] = self.get_sorted_boxes_for_goal(state, box_goal)
-        return goal_boxes
-
-    def get_sorted_boxes_for_goal(self, state: State, box_goal: Box):
-        boxes_for_goal = [
-            (
-                box,
-                self.get_distances(state, self.box_goal_positions[box_goal])[
-                    state.box_locations[box].row
-                ][state.box_locations[box].col],
-            )
-            for box in State.boxes[box_goal[0]]
-            if box_goal in self.box_goal_positions  # HACK: introduced key-check
-        ]
-        boxes_for_goal.sort(key=lambda x: x[1])
-        return boxes_for_goal
-
-    @staticmethod
-    def remove_box_from_other_goals(goal_boxes, new_box):
-        for box_goal in goal_boxes:
-            goal_boxes[box_goal] = [
-                (b, t) for (b, t) in goal_boxes[box_goal] if b != new_box
-            ]
 
     @staticmethod
     def get_path(distances, start_row, start_col):
@@ -349,16 +366,11 @@ class HeuristicComplexDijkstra(Heuristic):
                         break
         return path
 
-    def get_distances(self, state: State, position: Pos):
-        if position not in self.distances:
-            self.distances[position] = self.create_mapping(
-                state,
-                position.row,
-                position.col,
-                len(Location.walls),
-                len(Location.walls[0]),
-            )
-        return self.distances[position]
+    def get_distance(self, source: Pos, target: Pos) -> int:
+        """
+        BFS distance between two cells, UNREACHABLE (see distance_table) if there is no path.
+        """
+        return self.distances.distance(Location.cell(source), Location.cell(target))
 
     def create_mapping(
             self,
@@ -382,7 +394,7 @@ class HeuristicComplexDijkstra(Heuristic):
         def my_is_free(row, col):
             if take_boxes_into_account:
                 return eval_free(
-                    Location.all_locations(row, col), state.literals
+                    Location.cell((row, col)), state.occupancy
                 )  # FIXME Broke?
             else:
                 return Location.walls[row][col]
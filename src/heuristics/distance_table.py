@@ -0,0 +1,164 @@
+import hashlib
+import os
+import tempfile
+from typing import Iterable
+
+import numpy as np
+
+from src.domain.domain_types import Cell
+from src.domain.location import Location
+
+UNREACHABLE = np.iinfo(np.int16).max  # Distance of cells that cannot be reached (and from walls)
+ALL_PAIRS_BYTES = 64 << 20  # Maps whose all-pairs tensor fits in this are precomputed completely
+BATCH_SIZE = 256  # Sources per vectorized BFS, bounds the temporary (sources, rows, cols) arrays
+
+
+def fingerprint(sources: np.ndarray) -> str:
+    """
+    Cache key of a distance tensor: hash of the wall layout and the (sorted, unique) source cells.
+    """
+    digest = hashlib.sha1()
+    digest.update(np.array(Location.walls.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(Location.walls).tobytes())
+    digest.update(sources.astype(np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def bfs(sources: Iterable[Cell]) -> np.ndarray:
+    """
+    Unit-cost distances from every source to every cell, as an int16 array of shape (sources, cells)
+    indexed by dense cell id (see Location.cell). The wavefronts of all sources are expanded together,
+    one vectorized step per distance. Walls and unreachable cells get UNREACHABLE.
+    """
+    sources = np.fromiter(sources, dtype=np.int64)
+    free = ~Location.walls
+    num_rows, num_cols = free.shape
+    count = len(sources)
+
+    distances = np.full((count, num_rows, num_cols), UNREACHABLE, dtype=np.int16)
+    frontier = np.zeros((count, num_rows, num_cols), dtype=bool)
+    rows, cols = np.divmod(sources, num_cols)
+    on_free = free[rows, cols]
+    frontier[np.nonzero(on_free)[0], rows[on_free], cols[on_free]] = True
+    distances[frontier] = 0
+    reached = frontier.copy()
+
+    distance = 0
+    while frontier.any():
+        distance += 1
+        wave = np.zeros_like(frontier)
+        wave[:, 1:, :] |= frontier[:, :-1, :]
+        wave[:, :-1, :] |= frontier[:, 1:, :]
+        wave[:, :, 1:] |= frontier[:, :, :-1]
+        wave[:, :, :-1] |= frontier[:, :, 1:]
+        wave &= free
+        wave &= ~reached
+        distances[wave] = distance
+        reached |= wave
+        frontier = wave
+
+    return distances.reshape(count, num_rows * num_cols)
+
+
+class DistanceTable:
+    """
+    Precomputed BFS distances between cells. On maps where it fits in ALL_PAIRS_BYTES the table holds every
+    free cell as a source, otherwise only the given sources (goals, boxes, agents) and distances from any
+    other cell are computed the first time they are needed. Distances are symmetric, so a lookup uses
+    whichever of the two cells is a source.
+
+    With cache_dir set the tensor is saved there as a .npy file named by its fingerprint, and later
+    processes on the same level memory-map it read-only instead of running the BFS again.
+    """
+    cache_dir: str = None
+
+    def __init__(self, sources: Iterable[Cell] = ()):
+        num_cells = Location.walls.size
+        free_cells = np.flatnonzero(~Location.walls)
+        if len(free_cells) * num_cells * 2 <= ALL_PAIRS_BYTES:
+            sources = free_cells
+        else:
+            sources = np.unique(np.fromiter(sources, dtype=np.int64))
+
+        # Row of every source cell in the tensor, -1 for other cells
+        self.source_row = np.full(num_cells, -1, dtype=np.int32)
+        self.source_row[sources] = np.arange(len(sources), dtype=np.int32)
+        self.tensor = self.load(sources)
+        if self.tensor is None:
+            self.tensor = np.empty((len(sources), num_cells), dtype=np.int16)
+            for start in range(0, len(sources), BATCH_SIZE):
+                batch = sources[start:start + BATCH_SIZE]
+                self.tensor[start:start + len(batch)] = bfs(batch)
+            self.save(sources)
+        self.extra_rows: dict[Cell, np.ndarray] = {}
+
+    def cache_path(self, sources: np.ndarray) -> str:
+        return os.path.join(DistanceTable.cache_dir, fingerprint(sources) + ".npy")
+
+    def load(self, sources: np.ndarray) -> np.ndarray | None:
+        if DistanceTable.cache_dir is None:
+            return None
+        try:
+            tensor = np.load(self.cache_path(sources), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if tensor.shape != (len(sources), Location.walls.size) or tensor.dtype != np.int16:
+            return None
+        return tensor
+
+    def save(self, sources: np.ndarray):
+        """
+        Write the tensor to the cache. The file is written under a temporary name and renamed, so
+        concurrent processes either see the complete table or none. Failures leave the cache untouched.
+        """
+        if DistanceTable.cache_dir is None:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(DistanceTable.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=DistanceTable.cache_dir)
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, self.tensor)
+            os.replace(tmp_path, self.cache_path(sources))
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def row(self, cell: Cell) -> np.ndarray:
+        """
+        Distances from cell to every cell.
+        """
+        index = self.source_row[cell]
+        if index >= 0:
+            return self.tensor[index]
+        row = self.extra_rows.get(cell)
+        if row is None:
+            row = self.extra_rows[cell] = bfs((cell,))[0]
+        return row
+
+    def distance(self, a: Cell, b: Cell) -> int:
+        index = self.source_row[a]
+        if index >= 0:
+            return int(self.tensor[index, b])
+        index = self.source_row[b]
+        if index >= 0:
+            return int(self.tensor[index, a])
+        return int(self.row(a)[b])
+
+    def distances_to(self, cells: np.ndarray, cell: Cell) -> np.ndarray:
+        """
+        Distances from each of cells to cell.
+        """
+        index = self.source_row[cell]
+        if index >= 0:
+            return self.tensor[index, cells]
+        rows = self.source_row[cells]
+        if (rows >= 0).all():
+            return self.tensor[rows, cell]
+        return self.row(cell)[cells]
+
+    def grid(self, cell: Cell) -> np.ndarray:
+        """
+        Distances from cell as a (rows, cols) view.
+        """
+        return self.row(cell).reshape(Location.walls.shape)
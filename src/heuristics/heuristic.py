@@ -9,11 +9,6 @@ def extract_goal_positions(atom_type: AtomType, initial_state: State) -> dict[in
     return atoms_by_type(initial_state.goal_literals, atom_type)
 
 
-def count_goals_not_met(state: State, goal_positions: dict[Atom, Pos], atom_type: AtomType):
-    return sum(1 for item, goal_loc in goal_positions.items()
-               if any(lit.loc != goal_loc for lit in state.literals[atom_type]))
-
-
 class Heuristic(metaclass=ABCMeta):
     FIRST_ERROR = False
 
@@ -24,13 +19,35 @@ class Heuristic(metaclass=ABCMeta):
         self.num_cols = len(Location.walls[0])
 
     def h(self, state: 'State') -> 'int':
-        return count_goals_not_met(state, self.agent_goal_positions, AtomType.AGENT_AT) + \
-            count_goals_not_met(state, self.box_goal_positions, AtomType.BOX_AT)
+        return state.count_unsatisfied_goals()
+
+    def evaluate(self, state: 'State') -> 'int|float':
+        """
+        Heuristic value of a state or successor handle, computed at most once and cached on it.
+        The State of a handle is only built for the evaluation and not kept.
+        """
+        if state.h is None:
+            state.h = self.h(state.materialize())
+            state.release()
+        return state.h
+
+    def evaluate_successors(self, state: 'State', successors: list['State']) -> list['int|float']:
+        """
+        Heuristic values of the successors of a state that is being expanded.
+        """
+        return [self.evaluate(successor) for successor in successors]
 
     @abstractmethod
     def f(self, state: "State") -> "int|float":
         pass
 
+    def priority(self, g: int, h: int | float) -> "int|float":
+        """
+        Priority of a state from its g and h, as f computes it. Used for deferred evaluation, where a child
+        is queued with its own g and the h of its parent.
+        """
+        return h
+
     @abstractmethod
     def __repr__(self):
         raise NotImplementedError
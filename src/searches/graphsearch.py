@@ -1,14 +1,16 @@
+from array import array
 import gc
-from itertools import chain
+from itertools import chain, zip_longest
 import json
+import math
 import os
 import os.path
 import random
 import sys
 import time
 
-from src.domain.atom import atom_repr, get_atom_location
-from src.domain.domain_types import Atom
+from src.domain.atom import atom_repr
+from src.domain.domain_types import Atom, Cell
 from src.frontiers.baseline.best_first import FrontierBestFirst
 from src.frontiers.frontier import Frontier
 from src.frontiers.iw import FrontierIW
@@ -22,76 +24,152 @@ from src.utils.info import Info
 start_time = time.perf_counter()
 SAVED_ONCE = True
 random.seed(42)
+# Time budget of the searches in this process (see set_time_budget), checked every iteration, the memory limit
+# is checked every BUDGET_CHECK_INTERVAL iterations
+deadline = math.inf
+BUDGET_CHECK_INTERVAL = 1000
 
-def sort_by_y(x: Atom):
-    return get_atom_location(x)[0]
 
-def SIW(initial_state: State, frontier: FrontierIW):
+def set_time_budget(seconds: float):
+    global deadline
+    deadline = time.perf_counter() + seconds
+
+
+def budget_exceeded(iterations: int) -> bool:
+    if time.perf_counter() > deadline:
+        print("Time budget exceeded.", file=sys.stderr, flush=True)
+        return True
+    if iterations % BUDGET_CHECK_INTERVAL == 0 and memory.get_usage() > memory.max_usage:
+        print("Maximum memory usage exceeded.", file=sys.stderr, flush=True)
+        return True
+    return False
+
+
+GOAL_ORDERS = ("alternate", "agents", "boxes")
+
+
+def order_goals(initial_state: State, order: str = "alternate") -> list[Atom]:
+    """
+    The (masked) goal atoms of State.goal_literals_to_check in the order SIW reaches them: agent and box goals
+    alternating, agent goals first or box goals first (see GOAL_ORDERS).
+    """
+    agent_goals, box_goals = initial_state.goal_literals_to_check
+    if order == "agents":
+        return agent_goals + box_goals
+    if order == "boxes":
+        return box_goals + agent_goals
+    return [goal for pair in zip_longest(agent_goals, box_goals) for goal in pair if goal is not None]
+
+
+def SIW(initial_state: State, frontier: FrontierIW, goal_order: list[Atom] | None = None):
+    """
+    Serialized IW: reach the goals one at a time, each search starting from the state the previous one ended in
+    and having to keep the goals reached so far. goal_order lists the goals in the order to reach them (see
+    order_goals), by default agent and box goals alternate.
+    The heuristic (with its distance tables and the h cached on states) and the successors that passed the cutoff
+    at expanded states (see FrontierIW.expanded) are shared by all subgoal searches, only the novelty tables start
+    empty each time.
+    """
+    if goal_order is None:
+        goal_order = order_goals(initial_state)
+
+    goals = State.decode_goals(goal_order)
+    width = frontier.width if isinstance(frontier, FrontierIW) else None
     current_state = initial_state
     n_expl, n_front = 0, 0
-    
-    # goals = [sorted(a, key=sort_by_y) for a in initial_state.goal_literals_to_check]
-
-    size = len(initial_state.goal_literals_to_check[0]) + len(initial_state.goal_literals_to_check[1])
-    for i in range(1, size +1):
-        # State.goal_literals_to_check = (goals[0][:i], goals[1][:i])
-        print("#", frontier.size(), [atom_repr(a) for a in list(initial_state.goal_literals_to_check[0])[:i]])
-        print("#", frontier.size(), [atom_repr(a) for a in list(initial_state.goal_literals_to_check[1])[:i]])
-        state, explored, new_frontier = graph_search(current_state, frontier, i)
-        if not state: return None
+
+    for i in range(1, len(goals) + 1):
+        print("#", i, atom_repr(goal_order[i - 1]))
+        if width is not None:
+            frontier = frontier.restart(width)
+        state, explored, frontier_size = graph_search(current_state, frontier, goals[:i])
+        if not state:
+            return None, n_expl + explored, frontier_size
         current_state = state
-        n_expl += len(explored)
-        n_front += new_frontier.size()
+        n_expl += explored
+        n_front = frontier_size
 
     print("#", n_expl, n_front, n_expl + n_front)
 
     plan = current_state.extract_plan()
     # save_run_information(n_expl, n_front, plan)
-    return plan
+    return plan, n_expl, n_front
 
 
-def graph_search(initial_state: State, frontier: FrontierIW, g: int | None = None):
+def graph_search(initial_state: State, frontier: FrontierIW, goals: list[tuple[int, Cell, int]] | None = None):
+    """
+    Search from initial_state and return (plan, #explored, #frontier). With goals (decoded, see
+    State.decode_goals) the first state satisfying them is returned instead of a plan, as used by SIW.
+    """
     iterations = 0
+    # The satisfied goals of the prefix are counted incrementally on the states, see State.set_subgoals
+    State.set_subgoals(goals)
     frontier.add(initial_state)
-    explored = set()
 
     while True:
         iterations += 1
+        if budget_exceeded(iterations):
+            return None, frontier.table.closed_count, frontier.size()
 
         if frontier.is_empty():
             if isinstance(frontier, FrontierIW):
-                frontier = FrontierIW(frontier.heuristic, frontier.width + 1)
+                frontier = frontier.escalate()
                 frontier.add(initial_state)
-                explored = set()
                 if frontier.is_empty():
-                    return None, len(explored), frontier.size()
+                    return None, frontier.table.closed_count, frontier.size()
             else:
-                return None, len(explored), frontier.size()
+                return None, frontier.table.closed_count, frontier.size()
 
-        state = frontier.pop()
-        explored.add(state)
+        # The popped handle does not keep its State
+        handle = frontier.pop()
+        state = handle.materialize()
+        handle.release()
 
-        if state.is_goal_state(g):
-            if g is not None: 
-                return state, len(explored), frontier.size()
+        if state.satisfies_subgoals() if goals is not None else state.is_goal_state():
+            if goals is not None:
+                return state, frontier.table.closed_count, frontier.size()
             plan = state.extract_plan()
             # save_run_information(explored, frontier, plan)
-            return plan, len(explored), frontier.size()
-
-        expanded_states = state.get_expanded_states()
-
-        if isinstance(frontier, (FrontierIW, FrontierBestFirst)):
-            heuristics = [frontier.heuristic.h(s) for s in expanded_states]
-            randoms = [random.random() for _ in heuristics]
-            sorted_states = sorted(zip(heuristics, expanded_states, randoms), key=lambda x: (x[0], x[2]))
-            
-            #WARNING: By discarding unlikely states, we can achieve a massive speedup in some levels, but it might be problamatic in cases where our heuristic performs badly.
-            cutoff_index = max(int(len(sorted_states) * 0.2), 10)
-            expanded_states = [s for _, s, _ in sorted_states[:cutoff_index]]
-
-        for expanded_state in expanded_states:
-            if not frontier.contains(expanded_state) and expanded_state not in explored:
-                frontier.add(expanded_state)
+            return plan, frontier.table.closed_count, frontier.size()
+
+        # Successors are handles, their States are only built when needed (heuristic, novelty, popping)
+        successors = state.get_successors()
+
+        # States expanded at a lower IW width keep the children that passed the cutoff, with their h
+        cutoff = frontier.expanded.get(state) if isinstance(frontier, FrontierIW) else None
+        if cutoff is not None:
+            indices, heuristics = cutoff
+            successors = [successors[i] for i in indices]
+            for successor, h in zip(successors, heuristics):
+                successor.h = h
+
+        else:
+            # Only new states and states reached with a lower g than before are evaluated and (re)opened
+            indices = [i for i, successor in enumerate(successors) if frontier.table.improves(successor)]
+            successors = [successors[i] for i in indices]
+
+            # The cutoff needs the h of every child, so it is skipped when evaluation is deferred
+            if isinstance(frontier, (FrontierIW, FrontierBestFirst)) and not frontier.deferred:
+                # Children opened before take their h from the node table
+                for successor in successors:
+                    successor.h = frontier.table.cached_h(successor)
+                heuristics = frontier.heuristic.evaluate_successors(state, successors)
+                randoms = [random.random() for _ in heuristics]
+                order = sorted(range(len(successors)), key=lambda i: (heuristics[i], randoms[i]))
+
+                #WARNING: By discarding unlikely states, we can achieve a massive speedup in some levels, but it might be problamatic in cases where our heuristic performs badly.
+                cutoff_index = max(int(len(order) * 0.2), 10)
+                order = order[:cutoff_index]
+                successors = [successors[i] for i in order]
+
+                if isinstance(frontier, FrontierIW):
+                    frontier.expanded[state] = (array("L", (indices[i] for i in order)),
+                                                array("d", (heuristics[i] for i in order)))
+
+        # A state can be reached by several joint actions, only the first handle is queued
+        for successor in successors:
+            if frontier.table.improves(successor):
+                frontier.add(successor)
 
 
 def log_search_status(iterations, explored: set[State], frontier):
@@ -1,4 +1,5 @@
 from math import inf
+import os
 import psutil
 
 max_usage = inf
@@ -7,4 +8,7 @@ _process = psutil.Process()
 def get_usage() -> 'float':
     """ Returns memory usage of current process in MB. """
     global _process
+    # A forked worker process inherits the Process of its parent, measure the worker itself instead
+    if _process.pid != os.getpid():
+        _process = psutil.Process()
     return _process.memory_info().rss / (1024 * 1024)